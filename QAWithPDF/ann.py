@@ -0,0 +1,352 @@
+# Import os to build file paths inside the persist directory
+import os
+
+# Import time to measure search latency for the recall report
+import time
+
+# Import argparse to expose the recall/latency report on the command line
+import argparse
+
+# Import numpy for clustering and vectorized candidate scoring
+import numpy as np
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# File holding the IVF centroids and row assignments, next to the vector store
+IVF_FILE = "vector_store_ivf.npz"
+
+# Number of rows scored per block when assigning rows to centroids
+ASSIGN_BLOCK_SIZE = 8192
+
+# Default number of clusters scanned per query
+NPROBE = 8
+
+# Default number of live rows below which the exact scan is used instead
+MIN_TRAIN_SIZE = 2000
+
+# Retrain once the live rows reach this multiple of the rows the clustering was trained on
+RETRAIN_GROWTH = 2.0
+
+
+def top_k(scores, k):
+    """
+    Returns the indices of the k highest scores, best first.
+
+    Parameters:
+    - scores (np.ndarray): 1-D array of scores
+    - k (int): Number of results
+
+    Returns:
+    - np.ndarray: Indices into `scores`
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index in pure NumPy.
+
+    Unit-length vectors are clustered with spherical k-means; a query only
+    scores the rows assigned to its `nprobe` closest centroids. Raising
+    `nprobe` trades latency for recall. New rows are assigned to their
+    nearest existing centroid, so inserts never wait for training; once the
+    live rows grow to `retrain_growth` times the trained size, the owner
+    retrains (see NumpyVectorStore.train_ann) so the clusters and their
+    number keep up with the data.
+    Row numbers are shared with the NumpyVectorStore that owns the index.
+    """
+
+    def __init__(self, n_lists=None, nprobe=NPROBE, min_train_size=MIN_TRAIN_SIZE, kmeans_iters=10,
+                 retrain_growth=RETRAIN_GROWTH, seed=0):
+        """
+        Parameters:
+        - n_lists (int): Number of clusters (defaults to 4 * sqrt(rows) at training time)
+        - nprobe (int): Number of clusters scanned per query
+        - min_train_size (int): Below this many rows the exact scan is used instead
+        - kmeans_iters (int): Number of k-means iterations during training
+        - retrain_growth (float): Retrain when live rows reach this multiple of the trained size
+        - seed (int): Random seed for reproducible clustering
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.centroids = None
+        self.assignment = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        self.dirty = False
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def needs_training(self, live_rows):
+        """
+        Tells whether the index should be (re)trained for a store with `live_rows` live rows.
+
+        Returns:
+        - bool: True if the store is large enough and untrained, or has outgrown the clustering
+        """
+        if live_rows < self.min_train_size:
+            return False
+        return not self.trained or live_rows >= self.retrain_growth * self.trained_rows
+
+    def assign(self, vectors, centroids=None):
+        """
+        Finds the nearest centroid of every vector.
+
+        Parameters:
+        - vectors (np.ndarray): Unit-length rows
+        - centroids (np.ndarray): Centroids to assign to (defaults to the index's own)
+
+        Returns:
+        - np.ndarray: int32 cluster id per row
+        """
+        centroids = self.centroids if centroids is None else centroids
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+            block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE])
+            out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    def fit(self, matrix, alive):
+        """
+        Clusters the live rows of `matrix` without changing the index.
+
+        Parameters:
+        - matrix (np.ndarray): Unit-length float32 rows
+        - alive (np.ndarray): Boolean mask of rows that are not deleted (one entry per row)
+
+        Returns:
+        - tuple: (centroids, assignment of every row)
+        """
+        rng = np.random.default_rng(self.seed)
+        rows = np.flatnonzero(alive)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(len(rows))))
+        n_lists = min(n_lists, len(rows))
+
+        # Train on a bounded sample; assignment of the remaining rows is cheap
+        sample = np.asarray(matrix[np.sort(rng.choice(rows, size=min(len(rows), 64 * n_lists), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Re-seed empty clusters with random sample points
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        logging.info("Trained IVF index with %d lists over %d rows", n_lists, len(rows))
+        return centroids, self.assign(matrix[:len(alive)], centroids)
+
+    def install(self, centroids, assignment, trained_rows):
+        """
+        Replaces the clustering with one computed by `fit`.
+
+        Parameters:
+        - centroids (np.ndarray): Unit-length centroids
+        - assignment (np.ndarray): Cluster id of every row of the owning store
+        - trained_rows (int): Number of live rows the clustering was trained on
+        """
+        self.centroids = centroids
+        self.assignment = assignment
+        self.trained_rows = trained_rows
+        self.dirty = True
+
+    def train(self, matrix, alive):
+        """
+        Clusters the live rows of `matrix` and assigns every row to a cluster.
+
+        Parameters:
+        - matrix (np.ndarray): Unit-length float32 rows
+        - alive (np.ndarray): Boolean mask of rows that are not deleted
+        """
+        centroids, assignment = self.fit(matrix, alive)
+        self.install(centroids, assignment, int(alive.sum()))
+
+    def add(self, vectors):
+        """
+        Assigns newly appended rows to their nearest centroids.
+
+        Parameters:
+        - vectors (np.ndarray): Unit-length rows, in the order they were appended
+        """
+        if self.trained and len(vectors):
+            self.assignment = np.concatenate([self.assignment, self.assign(vectors)])
+            self.dirty = True
+
+    def compact(self, rows):
+        """
+        Keeps only the assignments of `rows`, matching a compaction of the store.
+
+        Parameters:
+        - rows (np.ndarray): Surviving row numbers, in their new order
+        """
+        if self.trained:
+            self.assignment = self.assignment[rows]
+            self.dirty = True
+
+    def probe(self, query_vector, mask, nprobe=None):
+        """
+        Returns the rows assigned to the clusters closest to a query.
+
+        Parameters:
+        - query_vector (np.ndarray): Unit-length query
+        - mask (np.ndarray): Boolean mask of rows that may be returned
+        - nprobe (int): Clusters to scan (defaults to the index setting)
+
+        Returns:
+        - np.ndarray: Candidate row numbers, in row order
+        """
+        probe = top_k(self.centroids @ query_vector, nprobe or self.nprobe)
+        return np.flatnonzero(np.isin(self.assignment, probe) & mask)
+
+    def search(self, query_vector, matrix, mask, k, nprobe=None):
+        """
+        Returns approximate top-k rows for a unit-length query vector.
+
+        Parameters:
+        - query_vector (np.ndarray): Unit-length query
+        - matrix (np.ndarray): The store's rows
+        - mask (np.ndarray): Boolean mask of rows that may be returned
+        - k (int): Number of results
+        - nprobe (int): Clusters to scan (defaults to the index setting)
+
+        Returns:
+        - tuple: (row numbers, similarities), best first
+        """
+        rows = self.probe(query_vector, mask, nprobe)
+        scores = np.asarray(matrix[rows]) @ query_vector
+        order = top_k(scores, k)
+        return rows[order], scores[order]
+
+    def save(self, persist_dir):
+        """
+        Writes centroids and assignments next to the vector store.
+
+        An untrained index removes any file left from an earlier store, so it
+        can never be loaded against rows it does not describe.
+        """
+        if not self.trained:
+            remove_ivf(persist_dir)
+            self.dirty = False
+            return
+        path = os.path.join(persist_dir, IVF_FILE)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, assignment=self.assignment, trained_rows=self.trained_rows)
+        os.replace(tmp, path)
+        self.dirty = False
+
+    def load(self, persist_dir, rows=None):
+        """
+        Restores centroids and assignments if they were persisted.
+
+        Parameters:
+        - persist_dir (str): Directory the store was persisted to
+        - rows (int): Number of rows in the store; a file with a different
+          number of assignments is stale and ignored (the index retrains lazily)
+
+        Returns:
+        - IVFIndex: self, for chaining
+        """
+        path = os.path.join(persist_dir, IVF_FILE)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                centroids, assignment = data["centroids"], data["assignment"]
+                trained_rows = data["trained_rows"] if "trained_rows" in data else None
+            if rows is not None and len(assignment) != rows:
+                logging.info("Ignoring stale IVF index (%d assignments for %d rows)", len(assignment), rows)
+                return self
+            self.centroids = centroids
+            self.assignment = assignment
+            self.trained_rows = int(trained_rows) if trained_rows is not None else len(assignment)
+        return self
+
+
+def remove_ivf(persist_dir):
+    """
+    Deletes the persisted IVF index of a persist directory, if any.
+
+    Parameters:
+    - persist_dir (str): Directory the store was persisted to
+    """
+    path = os.path.join(persist_dir, IVF_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def recall_report(matrix, k=5, n_queries=200, nprobes=(1, 2, 4, 8, 16, 32), n_lists=None, seed=0):
+    """
+    Measures recall@k and latency of the IVF index against the exact scan.
+
+    Queries are stored vectors perturbed with noise, so each has realistic neighbours.
+
+    Parameters:
+    - matrix (np.ndarray): Unit-length float32 rows to search
+    - k (int): Number of neighbours compared
+    - n_queries (int): Number of queries
+    - nprobes (tuple): nprobe settings to evaluate
+    - n_lists (int): Number of IVF clusters (defaults to 4 * sqrt(rows))
+    - seed (int): Random seed
+
+    Returns:
+    - list[dict]: One row for the exact scan and one per nprobe, with recall and latency
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    alive = np.ones(len(matrix), dtype=bool)
+
+    queries = matrix[rng.choice(len(matrix), size=n_queries)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Ground truth from the exact scan
+    start = time.perf_counter()
+    truth = [set(top_k(matrix @ q, k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+    report = [{"method": "exact", "nprobe": None, "recall_at_k": 1.0, "latency_ms": exact_ms}]
+
+    index = IVFIndex(n_lists=n_lists, min_train_size=0, seed=seed)
+    index.train(matrix, alive)
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [index.search(q, matrix, alive, k, nprobe=nprobe)[0] for q in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / n_queries
+        recall = np.mean([len(truth[i] & set(rows.tolist())) / k for i, rows in enumerate(found)])
+        report.append({"method": "ivf", "nprobe": nprobe, "recall_at_k": float(recall), "latency_ms": latency_ms})
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report IVF recall@k and latency against the exact scan.")
+    parser.add_argument("--persist-dir", default="storage", help="Storage directory holding vector_store.npy")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random 768-dim vectors instead")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data = np.random.default_rng(0).normal(size=(args.synthetic, 768)).astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+    else:
+        data = np.load(os.path.join(args.persist_dir, "vector_store.npy"), mmap_mode="r")
+
+    print(f"{'method':<8}{'nprobe':>8}{'recall@' + str(args.k):>12}{'latency ms':>14}")
+    for row in recall_report(data, k=args.k, n_queries=args.queries):
+        print(f"{row['method']:<8}{str(row['nprobe'] or '-'):>8}{row['recall_at_k']:>12.3f}{row['latency_ms']:>14.3f}")
@@ -0,0 +1,239 @@
+# Import hashlib to fingerprint the contents of an index
+import hashlib
+
+# Import threading so the cache can be shared between Streamlit sessions
+import threading
+
+# Import time to expire entries after their time-to-live
+import time
+
+# Import OrderedDict to keep entries in least-recently-used order
+from collections import OrderedDict
+
+# Import numpy to compare question embeddings
+import numpy as np
+
+# Import logging for tracking process flow, and metrics to count cache hits
+from logger import logging, metrics
+
+
+# Default cosine similarity above which a different question reuses a cached answer
+SIMILARITY_THRESHOLD = 0.95
+
+# Default number of seconds a cached answer stays valid
+ANSWER_TTL = 60 * 60
+
+# Default maximum number of cached answers across all indexes
+ANSWER_CACHE_MAX_ENTRIES = 1000
+
+
+def normalize_question(question):
+    """
+    Normalizes a question for exact matching (case and whitespace insensitive).
+
+    Parameters:
+    - question (str): The question as typed by the user
+
+    Returns:
+    - str: The normalized question
+    """
+    return " ".join(question.lower().split())
+
+
+def index_fingerprint(index):
+    """
+    Fingerprints the documents an index was built from.
+
+    The fingerprint changes whenever a document is added, changed or
+    removed, so answers cached for an older version of the index are
+    dropped automatically.
+
+    Parameters:
+    - index (VectorStoreIndex): The index answers are generated from
+
+    Returns:
+    - str: Hex digest of the index's document hashes
+    """
+    digest = hashlib.sha256()
+    for doc_hash in sorted(index.docstore.get_all_document_hashes()):
+        digest.update(doc_hash.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory LRU cache of answers keyed by index and question.
+
+    Lookups first try an exact match of the normalized question, then fall
+    back to the most similar cached question of the same index whose
+    embedding reaches `similarity_threshold`. Entries expire after `ttl`
+    seconds, the least recently used ones are evicted beyond `max_entries`,
+    and all answers of an index are dropped when its fingerprint changes.
+    """
+
+    def __init__(self, similarity_threshold=SIMILARITY_THRESHOLD, ttl=ANSWER_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        """
+        Parameters:
+        - similarity_threshold (float): Minimum cosine similarity for a near-duplicate hit (None disables the tier)
+        - ttl (float): Seconds a cached answer stays valid
+        - max_entries (int): Maximum number of cached answers
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _check_fingerprint(self, namespace, fingerprint):
+        """
+        Drops every answer of `namespace` if its index changed (caller holds the lock).
+        """
+        if self._fingerprints.get(namespace) == fingerprint:
+            return
+        if namespace in self._fingerprints:
+            stale = [key for key in self._entries if key[0] == namespace]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+            logging.info("Index %s changed; dropped %d cached answers", namespace[:12], len(stale))
+        self._fingerprints[namespace] = fingerprint
+
+    def _expired(self, entry, now):
+        return now - entry["created"] > self.ttl
+
+    def lookup(self, namespace, fingerprint, question, embed=None):
+        """
+        Returns a cached answer for a question, or None.
+
+        Parameters:
+        - namespace (str): Identifies the index (e.g. content hash of the upload)
+        - fingerprint (str): Current index_fingerprint of that index
+        - question (str): The question to answer
+        - embed (callable): Returns the embedding of a question; enables the similarity tier
+
+        Returns:
+        - str: The cached answer, or None on a miss
+        """
+        key = (namespace, normalize_question(question))
+        now = time.time()
+
+        with self._lock:
+            self._check_fingerprint(namespace, fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                metrics.count("answer_cache_hits", tier="exact")
+                return entry["answer"]
+
+            candidates = [
+                (cached_key, cached) for cached_key, cached in self._entries.items()
+                if cached_key[0] == namespace and cached["vector"] is not None and not self._expired(cached, now)
+            ]
+
+        if embed is not None and self.similarity_threshold is not None and candidates:
+            # Embedding happens outside the lock; retrieval reuses the cached query embedding on a miss
+            vector = _unit(embed(question))
+            scores = np.stack([cached["vector"] for _, cached in candidates]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                with self._lock:
+                    cached_key, cached = candidates[best]
+                    if cached_key in self._entries:
+                        self._entries.move_to_end(cached_key)
+                    self.similar_hits += 1
+                metrics.count("answer_cache_hits", tier="similar")
+                logging.info("Answered %r from cached question %r (similarity %.3f)", question, cached_key[1], scores[best])
+                return cached["answer"]
+
+        with self._lock:
+            self.misses += 1
+        metrics.count("answer_cache_misses")
+        return None
+
+    def store(self, namespace, fingerprint, question, answer, embed=None):
+        """
+        Caches the answer to a question.
+
+        Parameters:
+        - namespace (str): Identifies the index (e.g. content hash of the upload)
+        - fingerprint (str): index_fingerprint of the index that produced the answer
+        - question (str): The question that was answered
+        - answer (str): The generated answer
+        - embed (callable): Returns the embedding of a question; enables similarity matches for this entry
+        """
+        vector = _unit(embed(question)) if embed is not None and self.similarity_threshold is not None else None
+        key = (namespace, normalize_question(question))
+
+        with self._lock:
+            self._check_fingerprint(namespace, fingerprint)
+            self._entries[key] = {"answer": answer, "vector": vector, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace):
+        """
+        Drops every cached answer of an index.
+
+        Parameters:
+        - namespace (str): Identifies the index
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+            self._fingerprints.pop(namespace, None)
+
+    def stats(self):
+        """
+        Reports cache effectiveness.
+
+        Returns:
+        - dict: Entry count and exact/similar hit, miss and invalidation counters
+        """
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+def _unit(vector):
+    """
+    Returns a vector scaled to unit length as float32.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+# Process-wide answer cache shared by every Streamlit session
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    Returns the process-wide answer cache, creating it on first use.
+
+    Returns:
+    - AnswerCache: The shared cache
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AnswerCache()
+        return _shared_cache
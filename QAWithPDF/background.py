@@ -0,0 +1,255 @@
+# Import threading to build indexes without blocking the Streamlit script
+import threading
+
+# Import time to report how long a build has been running
+import time
+
+# Import the process-wide registry finished indexes are handed to
+from QAWithPDF.registry import get_index_registry, estimate_index_bytes
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+class IndexBuild:
+    """
+    Builds one index in a background thread and reports its progress.
+
+    `build(job)` does the actual work. It should stream its documents
+    through `job.count_pages` and pass `job.on_progress` to the index
+    builder, so pages parsed and chunks embedded are counted and the
+    partially built index becomes available as soon as its first chunks
+    are inserted.
+    """
+
+    def __init__(self, key, config, build, on_done=None):
+        """
+        Parameters:
+        - key (str): Registry key of the index (e.g. content hash of the upload)
+        - config (IndexConfig): Configuration the index is built with
+        - build (callable): build(job) returns the finished index
+        - on_done (callable): Called with the job after a successful build
+        """
+        self.key = key
+        self.config = config
+        self.index = None
+        self.error = None
+        self.pages_total = None
+        self.pages_parsed = 0
+        self.chunks_embedded = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._build = build
+        self._on_done = on_done
+        self._has_index = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"index-build-{key[:12]}", daemon=True)
+
+    @classmethod
+    def completed(cls, key, config, index):
+        """
+        Wraps an index that is already built (e.g. found in the registry).
+        """
+        job = cls(key, config, build=None)
+        job.index = index
+        job.finished = job.started
+        job._has_index.set()
+        job._done.set()
+        return job
+
+    def start(self):
+        """
+        Starts the build thread.
+
+        Returns:
+        - IndexBuild: This job
+        """
+        self._thread.start()
+        return self
+
+    def count_pages(self, documents):
+        """
+        Passes documents through while counting them as parsed pages.
+        """
+        for document in documents:
+            self.pages_parsed += 1
+            yield document
+
+    def on_progress(self, index, chunks):
+        """
+        Progress hook for load_or_build_index: records the partial index and embedded chunks.
+        """
+        self.index = index
+        self.chunks_embedded += chunks
+        self._has_index.set()
+
+    def _run(self):
+        try:
+            self.index = self._build(self)
+            self.finished = time.perf_counter()
+            logging.info(
+                "Background build of %s finished: %d pages, %d chunks in %.1fs",
+                self.key[:12], self.pages_parsed, self.chunks_embedded, self.finished - self.started
+            )
+            if self._on_done is not None:
+                self._on_done(self)
+        except Exception as e:
+            self.error = e
+            self.finished = time.perf_counter()
+            logging.info("Background build of %s failed: %s", self.key[:12], e)
+        finally:
+            self._has_index.set()
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the build to finish.
+
+        Returns:
+        - bool: True if the build finished within `timeout`
+        """
+        return self._done.wait(timeout)
+
+    def wait_for_index(self, timeout=None):
+        """
+        Waits until a (possibly partial) index can be queried.
+
+        Returns:
+        - The index, or None if none was available within `timeout`
+
+        Raises:
+        - The build's exception if it failed before producing an index
+        """
+        self._has_index.wait(timeout)
+        if self.index is None and self.error is not None:
+            raise self.error
+        return self.index
+
+    def result(self):
+        """
+        Returns the finished index, raising the build's exception if it failed.
+
+        Returns:
+        - tuple: (config, index)
+        """
+        self.wait()
+        if self.error is not None:
+            raise self.error
+        return self.config, self.index
+
+    def progress(self):
+        """
+        Reports build progress.
+
+        Returns:
+        - dict: Pages parsed (and expected), chunks embedded, elapsed seconds, done flag and error
+        """
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            "pages_parsed": self.pages_parsed,
+            "pages_total": self.pages_total,
+            "chunks_embedded": self.chunks_embedded,
+            "seconds": end - self.started,
+            "done": self.done,
+            "error": None if self.error is None else str(self.error),
+        }
+
+
+class IndexBuilder:
+    """
+    Process-wide table of background index builds.
+
+    Every session uploading the same file gets the same job. Finished
+    indexes move to the IndexRegistry, which then serves later requests.
+    """
+
+    def __init__(self, registry):
+        """
+        Parameters:
+        - registry (IndexRegistry): Receives (config, index) of finished builds
+        """
+        self.registry = registry
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, key, make_config, build, retry=False):
+        """
+        Returns the build for a key, starting one if none is running or cached.
+
+        A failed build is kept and returned (so callers can show its error)
+        until it is explicitly retried; Streamlit reruns the script on every
+        interaction and would otherwise restart the build each time.
+
+        Parameters:
+        - key (str): Registry key of the index
+        - make_config (callable): Returns the IndexConfig for a new build
+        - build (callable): build(job) returns the finished index (see IndexBuild)
+        - retry (bool): Replace a failed build of this key with a new one
+
+        Returns:
+        - IndexBuild: A running, finished or failed job
+        """
+        with self._lock:
+            existing = self._lookup(key, retry)
+        if existing is not None:
+            return existing
+
+        # Creating the config may set up model clients; other sessions need not wait for it
+        config = make_config()
+
+        with self._lock:
+            # Another session may have started the same build meanwhile
+            existing = self._lookup(key, retry)
+            if existing is not None:
+                return existing
+
+            logging.info("Starting background build of %s...", key[:12])
+            job = IndexBuild(key, config, build, on_done=self._finish)
+            self._jobs[key] = job
+            return job.start()
+
+    def _lookup(self, key, retry):
+        """
+        Returns the job or cached index for a key, or None if a build should start (caller holds the lock).
+        """
+        job = self._jobs.get(key)
+        if job is not None and not (retry and job.error is not None):
+            return job
+
+        cached = self.registry.get(key)
+        if cached is not None:
+            return IndexBuild.completed(key, *cached)
+        return None
+
+    def _finish(self, job):
+        """
+        Hands a finished index to the registry and forgets the job.
+        """
+        with self._lock:
+            self.registry.get_or_create(
+                job.key, lambda: ((job.config, job.index), estimate_index_bytes(job.index))
+            )
+            self._jobs.pop(job.key, None)
+
+
+# Process-wide builder shared by every Streamlit session
+_shared_builder = None
+_shared_builder_lock = threading.Lock()
+
+
+def get_index_builder():
+    """
+    Returns the process-wide index builder, creating it on first use.
+
+    Returns:
+    - IndexBuilder: The shared builder, backed by the shared index registry
+    """
+    global _shared_builder
+    with _shared_builder_lock:
+        if _shared_builder is None:
+            _shared_builder = IndexBuilder(get_index_registry())
+        return _shared_builder
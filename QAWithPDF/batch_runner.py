@@ -0,0 +1,255 @@
+# Import os and json to read questions and append answers as JSON lines
+import os
+import json
+
+# Import sys to pass system exception info to custom exception
+import sys
+
+# Import time to measure per-request and whole-run timings
+import time
+
+# Import argparse to expose the runner on the command line
+import argparse
+
+# Import asyncio to answer questions with bounded concurrency
+import asyncio
+
+# Import the same building blocks the Streamlit app uses
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.model_api import load_model, GOOGLE_API_KEY
+from QAWithPDF.embedding import download_gemini_embedding
+from QAWithPDF.index_storage import PERSIST_DIR
+from QAWithPDF.query import answer_one_async, query_key
+
+# Import custom exception class for controlled error handling
+from exception import customexception
+
+# Import logging for tracking process flow, and metrics for the per-stage summary
+from logger import logging, metrics
+
+
+# Default number of questions answered at the same time
+CONCURRENCY = 8
+
+# error_type of a result line for an input line that could not be read as a question
+INVALID_INPUT = "invalid_input"
+
+# error_type of a result line for a question whose answer failed (retried on the next run)
+QUERY_FAILED = "query_failed"
+
+
+def read_questions(path):
+    """
+    Lazily reads questions from a JSONL file.
+
+    Each line is a JSON object with a 'question' (or 'query') field and an
+    optional 'id' (or 'request_id'); lines without an id are numbered.
+    Lines that are not valid JSON or carry no question are yielded with an
+    error message instead, so they get a result line like any other record.
+
+    Parameters:
+    - path (str): Input JSONL file
+
+    Yields:
+    - tuple: (id, question, error) where error is None for a valid record
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield f"line-{line_number}", None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield f"line-{line_number}", None, "Expected a JSON object"
+                continue
+            question_id = str(record.get("id") or record.get("request_id") or f"line-{line_number}")
+            question = record.get("question") or record.get("query")
+            if not isinstance(question, str) or not question.strip():
+                yield question_id, None, "Missing 'question' (or 'query') field"
+                continue
+            yield question_id, question, None
+
+
+def completed_ids(path):
+    """
+    Reads the ids that were already answered successfully by an earlier run.
+
+    Parameters:
+    - path (str): Output JSONL file (may not exist yet)
+
+    Returns:
+    - set: Ids of answered questions and of invalid input lines; failed questions are retried
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run interrupted mid-write can leave a truncated last line
+                continue
+            # Rerunning an invalid line would only write the same error again
+            if record.get("error") is None or record.get("error_type") == INVALID_INPUT:
+                done.add(record.get("id"))
+    return done
+
+
+def _percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of a list of numbers.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _failed(question, error, error_type=QUERY_FAILED):
+    """
+    Returns a result record for a question that could not be answered.
+    """
+    return {"question": question, "answer": None, "error": error, "error_type": error_type,
+            "retrieval_seconds": None, "synthesis_seconds": None}
+
+
+async def run_async(query_engine, input_path, output_path, concurrency=CONCURRENCY):
+    """
+    Answers every question of a JSONL file and appends one result line per question.
+
+    Input is read lazily into a bounded queue consumed by `concurrency`
+    workers, so memory stays flat for any input size. Every answer is
+    flushed as soon as it completes; re-running with the same output file
+    skips questions that were already answered and invalid records, and
+    retries failed questions (the last line for an id wins). Invalid records
+    and unexpected errors produce an error line, marked by its error_type; if a worker or the reader fails outright, the
+    remaining tasks are cancelled and the error is raised.
+
+    Parameters:
+    - query_engine: A non-streaming query engine shared by all workers
+    - input_path (str): JSONL file of questions
+    - output_path (str): JSONL file answers are appended to
+    - concurrency (int): Number of questions in flight
+
+    Returns:
+    - dict: Counts, wall time, throughput and latency percentiles of the run
+    """
+    done = completed_ids(output_path)
+    queue = asyncio.Queue(maxsize=2 * concurrency)
+    latencies = []
+    counts = {"answered": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                question_id, question, error = item
+
+                began = time.perf_counter()
+                try:
+                    if error is not None:
+                        result = _failed(question, error, INVALID_INPUT)
+                    else:
+                        # Duplicate questions answered concurrently share one LLM call
+                        result = await answer_one_async(query_engine, question, key=query_key(id(query_engine), question))
+                except Exception as e:
+                    # Query errors are reported by answer_one_async; anything else still gets a result line
+                    logging.info("Question %s failed: %s", question_id, e)
+                    result = _failed(question, str(e) or type(e).__name__)
+                result.setdefault("error_type", None if result["error"] is None else QUERY_FAILED)
+                result["total_seconds"] = time.perf_counter() - began
+                result = {"id": question_id, **result}
+
+                # Checkpoint: every finished question is on disk before the next one starts
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+
+                latencies.append(result["total_seconds"])
+                counts["failed" if result["error"] else "answered"] += 1
+                if (counts["answered"] + counts["failed"]) % 100 == 0:
+                    logging.info("Batch progress: %s", counts)
+
+        async def produce():
+            for question_id, question, error in read_questions(input_path):
+                if question_id in done:
+                    counts["skipped"] += 1
+                    continue
+                await queue.put((question_id, question, error))
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        # A worker that dies would leave the producer blocked on the full queue,
+        # so the first error from any task stops the whole run
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in finished:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    processed = counts["answered"] + counts["failed"]
+    summary = {
+        **counts,
+        "seconds": elapsed,
+        "questions_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "p50_seconds": _percentile(latencies, 50),
+        "p95_seconds": _percentile(latencies, 95),
+        "p99_seconds": _percentile(latencies, 99),
+    }
+    logging.info("Batch run finished: %s", summary)
+    return summary
+
+
+def run(input_path, output_path, data="Data", persist_dir=PERSIST_DIR, concurrency=CONCURRENCY):
+    """
+    Builds (or reloads) one index over `data` and answers a JSONL file of questions against it.
+
+    Parameters:
+    - input_path (str): JSONL file of questions
+    - output_path (str): JSONL file answers are appended to
+    - data (str): File or directory of documents to index
+    - persist_dir (str): Directory the index is persisted to and reloaded from
+    - concurrency (int): Number of questions in flight
+
+    Returns:
+    - dict: Summary of the run
+    """
+    try:
+        # One index for the whole run; a persisted index only re-embeds changed documents
+        query_engine = download_gemini_embedding(
+            load_model(), load_data(data), GOOGLE_API_KEY, use_async=True, persist_dir=persist_dir
+        )
+        return asyncio.run(run_async(query_engine, input_path, output_path, concurrency))
+
+    except Exception as e:
+        # Raise a custom exception with detailed info if anything goes wrong
+        raise customexception(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions without the Streamlit UI.")
+    parser.add_argument("input", help="JSONL file with one {'id', 'question'} object per line")
+    parser.add_argument("output", help="JSONL file answers and timings are appended to (also the checkpoint)")
+    parser.add_argument("--data", default="Data", help="File or directory of documents to index")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR, help="Directory of the persisted index")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Questions answered at the same time")
+    args = parser.parse_args()
+
+    summary = run(args.input, args.output, args.data, args.persist_dir, args.concurrency)
+    print(json.dumps(summary, indent=2))
+
+    # Per-stage percentiles (parse, embed, retrieve, synthesize, ...) of this run
+    if metrics.enabled:
+        print(f"Stage metrics written to {metrics.dump()}")
@@ -0,0 +1,611 @@
+# Import os, json and tempfile to write synthetic corpora and save results
+import os
+import json
+import tempfile
+
+# Import sys, platform and subprocess to record the interpreter and commit a run belongs to
+import sys
+import platform
+import subprocess
+
+# Import time, random and zlib for timings and deterministic fake outputs
+import time
+import random
+import zlib
+
+# Import asyncio so the fake backends can wait without blocking the event loop
+import asyncio
+
+# Import argparse to expose the benchmark on the command line
+import argparse
+
+# Import resource to read the peak memory of a benchmark process (Linux / macOS)
+import resource
+
+# Import ProcessPoolExecutor and get_context to measure every corpus in a fresh process
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Import numpy to build normalized fake embeddings
+import numpy as np
+
+# Import the llama_index interfaces the fake backends implement
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.bridge.pydantic import Field
+
+# Import the real pipeline that is being measured
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.embedding import download_gemini_embedding
+from QAWithPDF.config import IndexConfig
+from QAWithPDF.embedding_cache import CachedEmbedding, EmbeddingCache
+from QAWithPDF.query import StreamedAnswer, answer_all
+from QAWithPDF.lexical import tokenize
+
+# Import logging for tracking process flow, and metrics for the per-stage breakdown
+from logger import logging, metrics
+
+
+# Corpus every synthetic corpus is sampled from
+SOURCE_CORPUS = os.path.join("Data", "MLDOC.txt")
+
+# Synthetic corpus sizes in pages, measured after the source corpus itself
+CORPUS_PAGES = (100, 1000, 3000)
+
+# Synthetic PDF corpus sizes in pages, parsed through the process-pool PDF path
+PDF_CORPUS_PAGES = (1000,)
+
+# Characters per synthetic page (roughly one printed page)
+PAGE_CHARS = 3000
+
+# Characters per text line on a synthetic PDF page
+PDF_LINE_CHARS = 95
+
+# Default latencies of the fake backends, in seconds
+EMBED_LATENCY = 0.05
+FIRST_TOKEN_LATENCY = 0.3
+TOKEN_LATENCY = 0.005
+
+# Number of tokens in every fake answer
+ANSWER_TOKENS = 64
+
+# Number of questions timed per corpus
+QUESTIONS = 40
+
+# Directory benchmark results are written to
+RESULTS_DIR = "benchmarks"
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Deterministic offline stand-in for GeminiEmbedding.
+
+    Texts are embedded by hashing their terms into `embed_dim` buckets, so
+    texts sharing words get similar vectors and retrieval behaves
+    plausibly. Every request (a single text or a whole batch) waits
+    `latency` seconds to imitate the API round trip.
+    """
+
+    latency: float = Field(default=EMBED_LATENCY, description="Seconds per embedding request")
+    embed_dim: int = Field(default=256, description="Vector dimension")
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("model_name", "fake-embedding")
+        super().__init__(**kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "FakeEmbedding"
+
+    def _vector(self, text):
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for term in tokenize(text):
+            vector[zlib.crc32(term.encode()) % self.embed_dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_text_embeddings(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts):
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query):
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query):
+        return await self._aget_text_embedding(query)
+
+
+class FakeLLM(CustomLLM):
+    """
+    Deterministic offline stand-in for the Gemini LLM.
+
+    The answer is the first `answer_tokens` words of the context in the
+    prompt. The first token arrives after `first_token_latency` seconds and
+    every further token after `token_latency` seconds, for both the
+    blocking, streaming and async calls.
+    """
+
+    first_token_latency: float = Field(default=FIRST_TOKEN_LATENCY, description="Seconds until the first token")
+    token_latency: float = Field(default=TOKEN_LATENCY, description="Seconds per further token")
+    answer_tokens: int = Field(default=ANSWER_TOKENS, description="Tokens per answer")
+
+    @classmethod
+    def class_name(cls):
+        return "FakeLLM"
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="fake-llm", num_output=self.answer_tokens, context_window=32768)
+
+    def _tokens(self, prompt):
+        # Skip the template's instructions and answer from the retrieved context
+        context = prompt.split("---------------------", 1)[-1]
+        return [word + " " for word in context.split()[:self.answer_tokens]] or ["Empty "]
+
+    def _latency(self, tokens):
+        return self.first_token_latency + self.token_latency * (len(tokens) - 1)
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        tokens = self._tokens(prompt)
+        time.sleep(self._latency(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        tokens = self._tokens(prompt)
+
+        def gen():
+            text = ""
+            for position, token in enumerate(tokens):
+                time.sleep(self.first_token_latency if position == 0 else self.token_latency)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._latency(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+
+def synthetic_pages(source_text, pages, page_chars=PAGE_CHARS, seed=0):
+    """
+    Generates the text of synthetic pages sampled from the source corpus.
+
+    Every page is a random selection of the source's sentences, so pages
+    (and their chunks) differ from each other while keeping the vocabulary
+    of the source. The same seed always produces the same pages.
+
+    Parameters:
+    - source_text (str): Text the sentences are sampled from
+    - pages (int): Number of pages
+    - page_chars (int): Approximate characters per page
+    - seed (int): Random seed
+
+    Yields:
+    - str: The text of each page, in order
+    """
+    sentences = [sentence.strip() + "." for sentence in source_text.replace("\n", " ").split(".") if len(sentence.split()) > 3]
+    rng = random.Random(seed)
+    for number in range(1, pages + 1):
+        parts = [f"Page {number}."]
+        length = 0
+        while length < page_chars:
+            sentence = rng.choice(sentences)
+            parts.append(sentence)
+            length += len(sentence) + 1
+        yield " ".join(parts)
+
+
+def make_corpus(source_text, pages, directory, page_chars=PAGE_CHARS, seed=0):
+    """
+    Writes a synthetic corpus of `pages` text files sampled from the source corpus.
+
+    Parameters:
+    - source_text (str): Text the sentences are sampled from
+    - pages (int): Number of pages to write
+    - directory (str): Directory receiving page_00001.txt, page_00002.txt, ...
+    - page_chars (int): Approximate characters per page
+    - seed (int): Random seed
+
+    Returns:
+    - int: Total size of the corpus in bytes
+    """
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    for number, text in enumerate(synthetic_pages(source_text, pages, page_chars, seed), start=1):
+        with open(os.path.join(directory, f"page_{number:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total += len(text.encode("utf-8"))
+    return total
+
+
+def _pdf_text(line):
+    """
+    Escapes one line of text as a PDF string literal (Latin-1, unsupported characters replaced).
+    """
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf_corpus(source_text, pages, path, page_chars=PAGE_CHARS, seed=0):
+    """
+    Writes a synthetic corpus as one PDF with `pages` text pages sampled from the source corpus.
+
+    The file is a minimal PDF (one Helvetica content stream per page) that
+    pypdf extracts text from, so the benchmark exercises the same parallel
+    page parsing as an uploaded PDF.
+
+    Parameters:
+    - source_text (str): Text the sentences are sampled from
+    - pages (int): Number of pages to write
+    - path (str): PDF file to create
+    - page_chars (int): Approximate characters per page
+    - seed (int): Random seed
+
+    Returns:
+    - int: Size of the PDF in bytes
+    """
+    # Objects 1-3 are the catalog, the page tree and the font; each page adds a page and a content object
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in synthetic_pages(source_text, pages, page_chars, seed):
+        words, lines, line = text.split(), [], ""
+        for word in words:
+            if line and len(line) + len(word) + 1 > PDF_LINE_CHARS:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        stream = ("BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(f"{_pdf_text(text_line)} Tj T*" for text_line in lines) + " ET").encode("latin-1")
+
+        page_number = len(objects) + 1
+        kids.append(f"{page_number} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_number + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+        return f.tell()
+
+
+def make_questions(source_text, count=QUESTIONS, seed=0):
+    """
+    Builds deterministic questions from the source corpus vocabulary.
+
+    Parameters:
+    - source_text (str): Text the question terms are drawn from
+    - count (int): Number of questions
+    - seed (int): Random seed
+
+    Returns:
+    - list[str]: The questions
+    """
+    terms = sorted({term for term in tokenize(source_text) if len(term) > 5 and not term.isdigit()})
+    rng = random.Random(seed)
+    return [f"What does the document say about {' '.join(rng.sample(terms, 2))}?" for _ in range(count)]
+
+
+def _percentiles(values):
+    """
+    Returns p50, p95 and p99 of a list of numbers.
+    """
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99)}
+
+
+def _directory_bytes(path):
+    """
+    Returns the total size of the files below `path`.
+    """
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def run_corpus(label, data, questions, settings):
+    """
+    Measures ingestion, index build, reload and queries for one corpus (runs in a fresh process).
+
+    Parameters:
+    - label (str): Name of the corpus in the report
+    - data (str): File or directory passed to load_data
+    - questions (list[str]): Questions timed against the index
+    - settings (dict): Fake backend latencies, 'use_async' and 'embed_dim'
+
+    Returns:
+    - dict: Measurements for this corpus
+    """
+    # Index, embedding cache and persisted files are removed when the measurement ends
+    with tempfile.TemporaryDirectory(prefix="qa_benchmark_", ignore_cleanup_errors=True) as workdir:
+        persist_dir = os.path.join(workdir, "storage")
+
+        # The same fake models are used for the build and the reload, so the index signature matches
+        llm = FakeLLM(
+            first_token_latency=settings["first_token_latency"],
+            token_latency=settings["token_latency"],
+            answer_tokens=settings["answer_tokens"],
+        )
+        embed_model = FakeEmbedding(latency=settings["embed_latency"], embed_dim=settings["embed_dim"])
+        config = IndexConfig(
+            llm=llm,
+            embed_model=CachedEmbedding(embed_model, EmbeddingCache(os.path.join(workdir, "embeddings.sqlite"))),
+        )
+
+        # Ingestion: parse every page into documents
+        start = time.perf_counter()
+        documents = load_data(data)
+        ingest_seconds = time.perf_counter() - start
+        source_bytes = sum(len(document.text.encode("utf-8")) for document in documents)
+
+        # Build: chunk, embed and persist a fresh index
+        start = time.perf_counter()
+        engine = download_gemini_embedding(
+            llm, documents, None, use_async=settings["use_async"], persist_dir=persist_dir, config=config, streaming=True
+        )
+        build_seconds = time.perf_counter() - start
+        chunks = metrics.snapshot()["counters"].get("chunks_embedded")
+        index_bytes = _directory_bytes(persist_dir)
+
+        # Reload: the persisted index with no document changes
+        start = time.perf_counter()
+        batch_engine = download_gemini_embedding(llm, documents, None, persist_dir=persist_dir, config=config)
+        load_seconds = time.perf_counter() - start
+
+        # Queries one at a time through the streaming path the app uses
+        retrieval, first_token, total = [], [], []
+        for question in questions:
+            answer = StreamedAnswer(engine, question)
+            for _ in answer:
+                pass
+            retrieval.append(answer.retrieval_time * 1000)
+            first_token.append((answer.time_to_first_token or answer.total_time) * 1000)
+            total.append(answer.total_time * 1000)
+
+        # The same questions at once through the concurrent batch path
+        start = time.perf_counter()
+        answer_all(batch_engine, questions)
+        batch_seconds = time.perf_counter() - start
+
+        result = {
+            "corpus": label,
+            "documents": len(documents),
+            "source_mb": source_bytes / 2**20,
+            "ingest": {
+                "seconds": ingest_seconds,
+                "documents_per_second": len(documents) / ingest_seconds if ingest_seconds > 0 else None,
+                "mb_per_second": source_bytes / 2**20 / ingest_seconds if ingest_seconds > 0 else None,
+            },
+            "build": {
+                "seconds": build_seconds,
+                "chunks": chunks,
+                "chunks_per_second": chunks / build_seconds if chunks and build_seconds > 0 else None,
+            },
+            "index": {"size_mb": index_bytes / 2**20, "load_seconds": load_seconds},
+            "query": {
+                "count": len(questions),
+                "retrieve_ms": _percentiles(retrieval),
+                "time_to_first_token_ms": _percentiles(first_token),
+                "total_ms": _percentiles(total),
+            },
+            "batch": {
+                "count": len(questions),
+                "seconds": batch_seconds,
+                "questions_per_second": len(questions) / batch_seconds if batch_seconds > 0 else None,
+            },
+            # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10),
+            "stages": metrics.snapshot()["spans"],
+        }
+    logging.info("Benchmark of %s finished: %s", label, result)
+    return result
+
+
+def _commit():
+    """
+    Returns the short hash of the checked-out commit, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(pages=CORPUS_PAGES, source=SOURCE_CORPUS, questions=QUESTIONS, pdf_pages=PDF_CORPUS_PAGES, **settings):
+    """
+    Benchmarks the pipeline on the source corpus, on synthetic corpora of increasing size
+    and on synthetic PDFs.
+
+    Every corpus is measured in its own process, so peak memory and the
+    process-wide caches and metrics belong to that corpus alone.
+
+    Parameters:
+    - pages (tuple): Sizes of the synthetic corpora in pages
+    - source (str): Text file used as the first corpus and sampled for the others
+    - questions (int): Number of questions timed per corpus
+    - pdf_pages (tuple): Sizes in pages of synthetic corpora written as one PDF each
+    - settings: Overrides of the fake backend latencies, 'use_async' and 'embed_dim'
+
+    Returns:
+    - dict: Run metadata, settings and one result per corpus
+    """
+    settings = {
+        "embed_latency": EMBED_LATENCY,
+        "first_token_latency": FIRST_TOKEN_LATENCY,
+        "token_latency": TOKEN_LATENCY,
+        "answer_tokens": ANSWER_TOKENS,
+        "embed_dim": 256,
+        "use_async": True,
+        **settings,
+    }
+    with open(source, encoding="utf-8") as f:
+        source_text = f.read()
+    question_list = make_questions(source_text, questions)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="qa_corpora_") as root:
+        corpora = [(os.path.basename(source), source)]
+        for count in pages:
+            directory = os.path.join(root, f"pages_{count}")
+            make_corpus(source_text, count, directory)
+            corpora.append((f"{count} pages", directory))
+        for count in pdf_pages:
+            path = os.path.join(root, f"pdf_{count}", "corpus.pdf")
+            make_pdf_corpus(source_text, count, path)
+            corpora.append((f"{count}-page PDF", path))
+
+        for label, data in corpora:
+            logging.info("Benchmarking %s...", label)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                results.append(pool.submit(run_corpus, label, data, question_list, settings).result())
+            print(format_row(results[-1]), flush=True)
+
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": settings,
+        "corpora": results,
+    }
+
+
+# Columns of the printed summary: (header, path into a corpus result, width, decimals)
+COLUMNS = (
+    ("corpus", ("corpus",), 14, None),
+    ("docs", ("documents",), 6, 0),
+    ("ingest MB/s", ("ingest", "mb_per_second"), 12, 2),
+    ("build s", ("build", "seconds"), 9, 2),
+    ("chunks/s", ("build", "chunks_per_second"), 9, 0),
+    ("index MB", ("index", "size_mb"), 9, 2),
+    ("load s", ("index", "load_seconds"), 8, 2),
+    ("peak MB", ("peak_rss_mb",), 8, 0),
+    ("retr p95 ms", ("query", "retrieve_ms", "p95"), 12, 1),
+    ("ttft p95 ms", ("query", "time_to_first_token_ms", "p95"), 12, 1),
+    ("batch q/s", ("batch", "questions_per_second"), 10, 1),
+)
+
+
+def _lookup(result, path):
+    """
+    Follows a path of keys into a nested result, returning None if any is missing.
+    """
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def format_header():
+    """
+    Returns the header line of the printed summary.
+    """
+    return "".join(f"{header:<{width}}" if decimals is None else f"{header:>{width}}" for header, _, width, decimals in COLUMNS)
+
+
+def format_row(result):
+    """
+    Formats the headline numbers of one corpus result as a table row.
+    """
+    cells = []
+    for _, path, width, decimals in COLUMNS:
+        value = _lookup(result, path)
+        if decimals is None:
+            cells.append(f"{value:<{width}}")
+        elif value is None:
+            cells.append(f"{'-':>{width}}")
+        else:
+            cells.append(f"{value:>{width}.{decimals}f}")
+    return "".join(cells)
+
+
+def compare(current, baseline):
+    """
+    Prints the change of every headline number against an earlier run.
+
+    Parameters:
+    - current (dict): Result of run_benchmark
+    - baseline (dict): Earlier result loaded from its JSON file
+    """
+    previous = {result["corpus"]: result for result in baseline["corpora"]}
+    print(f"\nChange vs {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    for result in current["corpora"]:
+        before = previous.get(result["corpus"])
+        if before is None:
+            continue
+        changes = []
+        for header, path, _, _ in COLUMNS[2:]:
+            old, new = _lookup(before, path), _lookup(result, path)
+            if old and new is not None:
+                changes.append(f"{header} {100 * (new - old) / old:+.0f}%")
+        print(f"  {result['corpus']:<14}" + ", ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, indexing and queries offline with fake Gemini backends.")
+    parser.add_argument("--pages", type=int, nargs="*", default=list(CORPUS_PAGES), help="Synthetic corpus sizes in pages")
+    parser.add_argument("--pdf-pages", type=int, nargs="*", default=list(PDF_CORPUS_PAGES), help="Synthetic PDF sizes in pages")
+    parser.add_argument("--source", default=SOURCE_CORPUS, help="Text file the synthetic corpora are sampled from")
+    parser.add_argument("--questions", type=int, default=QUESTIONS, help="Questions timed per corpus")
+    parser.add_argument("--embed-latency", type=float, default=EMBED_LATENCY, help="Seconds per fake embedding request")
+    parser.add_argument("--first-token-latency", type=float, default=FIRST_TOKEN_LATENCY, help="Seconds until the fake LLM's first token")
+    parser.add_argument("--token-latency", type=float, default=TOKEN_LATENCY, help="Seconds per further fake LLM token")
+    parser.add_argument("--sync", action="store_true", help="Build indexes without the async embedding pipeline")
+    parser.add_argument("--output", help=f"Result file (defaults to {RESULTS_DIR}/<commit>_<time>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    print(format_header())
+    report = run_benchmark(
+        pages=tuple(args.pages), source=args.source, questions=args.questions, pdf_pages=tuple(args.pdf_pages),
+        embed_latency=args.embed_latency, first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency, use_async=not args.sync,
+    )
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['commit'] or 'local'}_{report['timestamp'].replace(':', '')}.json"
+    )
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
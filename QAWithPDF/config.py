@@ -0,0 +1,155 @@
+# Import dataclass to declare the per-index configuration
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Import the sentence splitter used to chunk documents
+from llama_index.core.node_parser import SentenceSplitter
+
+# Import the query engine that answers from any retriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+# Import the keyword and fused retrievers
+from QAWithPDF.lexical import BM25Retriever, HybridRetriever
+
+# Import the approximate nearest-neighbour index used once a store grows large
+from QAWithPDF.ann import IVFIndex, NPROBE, MIN_TRAIN_SIZE, RETRAIN_GROWTH
+
+# Import the post-retrieval stage that dedupes, reranks and trims the context
+from QAWithPDF.context import ContextAssembler
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# Default maximum chunk size (in tokens) for splitting documents
+CHUNK_SIZE = 800
+
+# Default overlap (in tokens) between consecutive chunks
+CHUNK_OVERLAP = 20
+
+# Default retrieval: 'dense' (vectors), 'lexical' (BM25, no query embedding) or 'hybrid' (both, fused)
+RETRIEVAL_MODE = "dense"
+
+# Default number of chunks retrieved per question (llama_index's own default)
+SIMILARITY_TOP_K = 2
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    """
+    Models and chunking settings for one index.
+
+    Passed explicitly to the index, its node parser and its query engine
+    instead of writing llama_index's global `Settings`, so several indexes
+    with different settings can be built and queried in parallel threads.
+
+    Attributes:
+    - llm: The LLM used to synthesize answers
+    - embed_model: The embedding model used for chunks and queries
+    - chunk_size (int): Maximum chunk size in tokens
+    - chunk_overlap (int): Overlap between consecutive chunks in tokens
+    - retrieval_mode (str): 'dense', 'lexical' or 'hybrid'
+    - similarity_top_k (int): Number of chunks retrieved per question
+    - context_token_budget (int): Maximum context tokens sent to the LLM (None, the default, passes chunks unchanged)
+    - ivf_n_lists (int): Number of IVF clusters (None sizes them from the row count at training time)
+    - ivf_nprobe (int): Number of IVF clusters scanned per query
+    - ivf_min_train_size (int): Live rows below which the exact scan is used instead of IVF
+    - ivf_retrain_growth (float): Retrain IVF when live rows reach this multiple of the trained size
+    """
+
+    llm: Any = None
+    embed_model: Any = None
+    chunk_size: int = CHUNK_SIZE
+    chunk_overlap: int = CHUNK_OVERLAP
+    retrieval_mode: str = RETRIEVAL_MODE
+    similarity_top_k: int = SIMILARITY_TOP_K
+    context_token_budget: Optional[int] = None
+    ivf_n_lists: Optional[int] = None
+    ivf_nprobe: int = NPROBE
+    ivf_min_train_size: int = MIN_TRAIN_SIZE
+    ivf_retrain_growth: float = RETRAIN_GROWTH
+
+    def node_parser(self):
+        """
+        Returns a node parser that chunks documents with this configuration.
+        """
+        return SentenceSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+
+    def index_kwargs(self):
+        """
+        Returns the keyword arguments that bind a VectorStoreIndex to this configuration.
+        """
+        return {"embed_model": self.embed_model, "transformations": [self.node_parser()]}
+
+    def ann_index(self):
+        """
+        Creates the (untrained) IVF index a new or reloaded vector store is searched through.
+
+        IVF settings only affect search, not how documents are chunked or
+        embedded, so they are not part of `signature`.
+        """
+        return IVFIndex(
+            n_lists=self.ivf_n_lists,
+            nprobe=self.ivf_nprobe,
+            min_train_size=self.ivf_min_train_size,
+            retrain_growth=self.ivf_retrain_growth,
+        )
+
+    def retriever(self, index):
+        """
+        Creates the retriever selected by `retrieval_mode` for `index`.
+
+        Falls back to dense retrieval when the index's vector store has no
+        keyword index.
+
+        Parameters:
+        - index (VectorStoreIndex): Index built with this configuration
+
+        Returns:
+        - BaseRetriever: The configured retriever
+        """
+        dense = index.as_retriever(similarity_top_k=self.similarity_top_k)
+        lexical_index = getattr(index.vector_store, "lexical", None)
+        if self.retrieval_mode == "dense" or lexical_index is None:
+            if self.retrieval_mode != "dense":
+                logging.info("No BM25 index available; using dense retrieval")
+            return dense
+
+        lexical = BM25Retriever(lexical_index, index.docstore, self.similarity_top_k)
+        if self.retrieval_mode == "lexical":
+            return lexical
+        return HybridRetriever(dense, lexical, self.similarity_top_k)
+
+    def query_engine(self, index, **kwargs):
+        """
+        Creates a query engine for `index` that answers with this configuration's LLM.
+
+        Retrieved chunks pass through a ContextAssembler before synthesis
+        when `context_token_budget` is set.
+
+        Parameters:
+        - index (VectorStoreIndex): Index built with this configuration
+        - kwargs: Extra options forwarded to `RetrieverQueryEngine.from_args` (e.g. streaming)
+
+        Returns:
+        - query_engine: The configured query engine
+        """
+        postprocessors = list(kwargs.pop("node_postprocessors", None) or [])
+        if self.context_token_budget is not None:
+            postprocessors.append(ContextAssembler(token_budget=self.context_token_budget))
+        return RetrieverQueryEngine.from_args(
+            self.retriever(index), llm=self.llm, node_postprocessors=postprocessors, **kwargs
+        )
+
+    def signature(self):
+        """
+        Describes the settings that determine how documents are chunked and embedded.
+
+        Returns:
+        - dict: Embedding model name, chunk size and chunk overlap
+        """
+        return {
+            "embed_model": getattr(self.embed_model, "model_name", None),
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+        }
@@ -0,0 +1,156 @@
+# Import re to split chunks into sentences
+import re
+
+# Import math for the inverse document frequency of query terms
+import math
+
+# Import the postprocessor interface and node types used by llama_index
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore
+
+# Import the tokenizer llama_index uses to count prompt tokens
+from llama_index.core.utils import get_tokenizer
+
+# Import the term splitter shared with the BM25 index
+from QAWithPDF.lexical import tokenize
+
+# Import logging for tracking process flow, and metrics to count prompt tokens
+from logger import logging, metrics
+
+
+# Default maximum number of context tokens sent to the LLM per question
+CONTEXT_TOKEN_BUDGET = 1000
+
+# Word-trigram Jaccard similarity above which a chunk counts as a near-duplicate
+DUPLICATE_THRESHOLD = 0.8
+
+# Weight of the retriever's rank relative to query-term coverage when reranking
+RANK_PRIOR = 0.5
+
+# Sentence boundaries: end punctuation followed by whitespace, or blank lines
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def _shingles(text):
+    """
+    Returns the set of word trigrams of a text.
+    """
+    words = tokenize(text)
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class ContextAssembler(BaseNodePostprocessor):
+    """
+    Post-retrieval stage that shrinks the context before synthesis.
+
+    1. Drops chunks whose word trigrams overlap an already kept chunk by
+       more than `duplicate_threshold` (e.g. neighbouring chunks sharing
+       their overlap, or the same page uploaded twice).
+    2. Reranks the rest by idf-weighted coverage of the query terms, with
+       the retriever's rank as a prior; no model call is involved.
+    3. If the chunks exceed `token_budget`, keeps the sentences that cover
+       the most query terms, in their original order, until the budget is
+       reached.
+
+    Returned nodes are copies: the shared docstore nodes are never modified.
+    """
+
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    duplicate_threshold: float = DUPLICATE_THRESHOLD
+    rank_prior: float = RANK_PRIOR
+
+    @classmethod
+    def class_name(cls):
+        return "ContextAssembler"
+
+    def _dedupe(self, nodes):
+        """
+        Keeps the first of every group of near-duplicate chunks.
+        """
+        kept, kept_shingles = [], []
+        for node in nodes:
+            shingles = _shingles(node.node.get_content())
+            if any(_jaccard(shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(node)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not nodes or query_bundle is None:
+            return nodes
+
+        count_tokens = get_tokenizer()
+        tokens_before = sum(len(count_tokens(node.node.get_content())) for node in nodes)
+
+        candidates = self._dedupe(nodes)
+
+        # Query terms weighted by how rare they are among the retrieved chunks
+        chunk_terms = [set(tokenize(node.node.get_content())) for node in candidates]
+        query_terms = set(tokenize(query_bundle.query_str))
+        weights = {
+            term: math.log((len(candidates) + 1) / (sum(term in terms for terms in chunk_terms) + 0.5))
+            for term in query_terms
+        }
+        total_weight = sum(weights.values()) or 1.0
+
+        def coverage(terms):
+            return sum(weight for term, weight in weights.items() if term in terms) / total_weight
+
+        # Rerank: query-term coverage plus a prior for the retriever's own rank
+        ranked = sorted(
+            zip(candidates, chunk_terms, range(len(candidates))),
+            key=lambda item: coverage(item[1]) + self.rank_prior / (item[2] + 1),
+            reverse=True,
+        )
+
+        ranked_nodes = [node for node, _, _ in ranked]
+        used = sum(len(count_tokens(node.node.get_content())) for node in ranked_nodes)
+        if used <= self.token_budget:
+            self._log(nodes, ranked_nodes, tokens_before, used)
+            return ranked_nodes
+
+        # Split into sentences and pick the most relevant ones until the budget is spent
+        sentences, sentence_counts = [], []
+        for position, node in enumerate(ranked_nodes):
+            parts = [part for part in SENTENCE_PATTERN.split(node.node.get_content()) if part.strip()]
+            sentence_counts.append(len(parts))
+            for order, sentence in enumerate(parts):
+                score = coverage(set(tokenize(sentence))) + self.rank_prior / (position + 1)
+                sentences.append((score, position, order, sentence, len(count_tokens(sentence))))
+
+        chosen, used = set(), 0
+        for score, position, order, sentence, tokens in sorted(sentences, key=lambda s: s[0], reverse=True):
+            if used + tokens > self.token_budget and chosen:
+                continue
+            chosen.add((position, order))
+            used += tokens
+
+        assembled = []
+        for position, node in enumerate(ranked_nodes):
+            kept = [s[3] for s in sentences if s[1] == position and (position, s[2]) in chosen]
+            if not kept:
+                continue
+            if len(kept) < sentence_counts[position]:
+                copy = node.node.model_copy()
+                copy.set_content(" ".join(kept))
+                node = NodeWithScore(node=copy, score=node.score)
+            assembled.append(node)
+
+        self._log(nodes, assembled, tokens_before, used)
+        return assembled
+
+    def _log(self, nodes, assembled, tokens_before, tokens_after):
+        """
+        Logs how many chunks and prompt tokens the stage saved for one question.
+        """
+        logging.info(
+            "Context assembly: %d -> %d chunks, %d -> %d tokens (%d saved)",
+            len(nodes), len(assembled), tokens_before, tokens_after, tokens_before - tokens_after
+        )
+        metrics.count("context_tokens", tokens_after)
+        metrics.count("context_tokens_saved", tokens_before - tokens_after)
@@ -1,47 +1,215 @@
 # Import SimpleDirectoryReader to read documents from a directory
-from llama_index.core import SimpleDirectoryReader  
+from llama_index.core import SimpleDirectoryReader
+
+# Import Document to wrap parsed pages and uploaded text
+from llama_index.core import Document
+
+# Import PdfReader to parse PDFs one page at a time
+from pypdf import PdfReader
+
+# Import ProcessPoolExecutor to parse PDF pages in parallel worker processes
+from concurrent.futures import ProcessPoolExecutor
+
+# Import deque and islice to keep a bounded window of in-flight parse tasks
+from collections import deque
+from itertools import islice
+
+# Import os and tempfile to handle paths and spill uploaded PDFs to disk
+import os
+import tempfile
+
+# Import BytesIO to count the pages of an uploaded PDF without writing it to disk
+from io import BytesIO
 
 # Import sys to pass system exception details to the custom exception
-import sys  
+import sys
 
 # Import the custom exception class from your exception module
-from exception import customexception  
+from exception import customexception
+
+# Import logging for capturing process information, and metrics to time parsing
+from logger import logging, metrics
+
 
-# Import logging for capturing process information
-from logger import logging  
+# Directory read when no upload or path is given
+DATA_DIR = "Data"
 
+# Number of PDF pages parsed by one worker task
+PDF_PAGES_PER_TASK = 8
 
-def load_data(data):
+# Number of parse tasks kept ahead of the consumer; bounds memory to depth * pages per task
+PIPELINE_DEPTH = 4
+
+
+def _parse_pdf_pages(path, start, stop):
     """
-    Load PDF documents from a specified directory.
+    Extracts the text of a range of PDF pages (runs in a worker process).
 
     Parameters:
-    - data (str): The path to the directory containing PDF files.
+    - path (str): Path of the PDF file
+    - start (int): First page index (0-based, inclusive)
+    - stop (int): Last page index (exclusive)
 
     Returns:
-    - A list of loaded PDF documents. The specific type of documents may vary.
+    - list[tuple]: (page number, text) for each page in the range
+    """
+    reader = PdfReader(path)
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+
+def iter_pdf_pages(path, name, workers=None, depth=PIPELINE_DEPTH):
+    """
+    Yields one document per PDF page, parsing page ranges in a process pool.
+
+    Only `depth` page ranges are parsed ahead of the consumer, so later pages
+    are still being parsed while earlier ones are chunked and embedded.
+
+    Parameters:
+    - path (str): Path of the PDF file
+    - name (str): File name used for document ids and metadata
+    - workers (int): Number of worker processes (defaults to the CPU count)
+    - depth (int): Number of page ranges parsed ahead of the consumer
+
+    Yields:
+    - Document: One document per non-empty page
+    """
+    page_count = len(PdfReader(path).pages)
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+    def to_documents(pages):
+        for page_number, text in pages:
+            if text.strip():
+                yield Document(
+                    text=text,
+                    id_=f"{name}_page_{page_number}",
+                    metadata={"file_name": name, "page_label": str(page_number)},
+                )
+
+    # Small PDFs are not worth the cost of starting worker processes
+    if len(ranges) <= 1:
+        for start, stop in ranges:
+            with metrics.span("parse", pages=stop - start):
+                pages = _parse_pdf_pages(path, start, stop)
+            yield from to_documents(pages)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(ranges)
+        pending = deque(pool.submit(_parse_pdf_pages, path, *page_range) for page_range in islice(remaining, depth))
+
+        while pending:
+            # Only time spent waiting on the workers counts as parsing
+            with metrics.span("parse") as span:
+                pages = pending.popleft().result()
+                span.set(pages=len(pages))
+
+            # Keep the window full before handing pages to the consumer
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append(pool.submit(_parse_pdf_pages, path, *next_range))
+
+            yield from to_documents(pages)
+
+
+def _iter_file(path, name, workers, depth):
+    """
+    Yields the documents of a single file on disk.
+    """
+    if path.lower().endswith(".pdf"):
+        yield from iter_pdf_pages(path, name, workers=workers, depth=depth)
+    else:
+        # Use file names as document ids so a persisted index can recognise them on reload
+        with metrics.span("parse", pages=1):
+            documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+        yield from documents
+
+
+def _iter_upload(upload, workers, depth):
+    """
+    Yields the documents of an uploaded file (e.g. a Streamlit UploadedFile).
+    """
+    name = getattr(upload, "name", "upload")
+    content = upload.getvalue() if hasattr(upload, "getvalue") else upload.read()
+
+    if not name.lower().endswith(".pdf"):
+        yield Document(text=content.decode("utf-8", errors="replace"), id_=name, metadata={"file_name": name})
+        return
+
+    # Worker processes need a path to open, so spill the PDF to a temporary file
+    handle, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(content)
+        yield from iter_pdf_pages(path, name, workers=workers, depth=depth)
+    finally:
+        os.remove(path)
+
+
+def upload_page_count(upload):
+    """
+    Counts the pages an upload will be parsed into, for progress reporting.
+
+    Parameters:
+    - upload: A Streamlit upload buffer (or any file-like object with a name)
+
+    Returns:
+    - int: Number of PDF pages, or 1 for text files
+    """
+    name = getattr(upload, "name", "upload")
+    if not name.lower().endswith(".pdf"):
+        return 1
+    content = upload.getvalue() if hasattr(upload, "getvalue") else upload.read()
+    return len(PdfReader(BytesIO(content)).pages)
+
+
+def iter_documents(data=DATA_DIR, workers=None, depth=PIPELINE_DEPTH):
+    """
+    Streams documents from an uploaded file, a file path or a directory.
+
+    Parameters:
+    - data: A Streamlit upload buffer (or any file-like object), a file path or a directory path
+    - workers (int): Number of PDF parsing processes (defaults to the CPU count)
+    - depth (int): Number of PDF page ranges parsed ahead of the consumer
+
+    Yields:
+    - Document: Parsed documents (one per page for PDFs)
     """
     try:
         # Log the start of the data loading process
         logging.info("Data loading started...")
-        
-        # Initialize the document loader for the specified directory
-        # Currently, the directory is hardcoded as "Data" instead of using 'data' parameter
-        loader = SimpleDirectoryReader("Data")  
-        
-        # Load all documents from the directory into a list
-        documents = loader.load_data()  
-        
+
+        if hasattr(data, "read") or hasattr(data, "getvalue"):
+            yield from _iter_upload(data, workers, depth)
+        elif os.path.isdir(data):
+            for file_name in sorted(os.listdir(data)):
+                path = os.path.join(data, file_name)
+                if os.path.isfile(path) and not file_name.startswith("."):
+                    yield from _iter_file(path, path, workers, depth)
+        else:
+            yield from _iter_file(data, data, workers, depth)
+
         # Log successful completion of data loading
         logging.info("Data loading completed...")
-        
-        # Return the loaded documents
-        return documents  
 
     except Exception as e:
         # Log that an exception occurred during data loading
         logging.info("Exception occurred in loading data...")
-        
+
         # Raise a custom exception with details about the original exception
         raise customexception(e, sys)
-  
\ No newline at end of file
+
+
+def load_data(data=DATA_DIR):
+    """
+    Load documents from an uploaded file, a file path or a directory.
+
+    Parameters:
+    - data: A Streamlit upload buffer, a file path or a directory path (defaults to "Data")
+
+    Returns:
+    - A list of loaded documents. Use iter_documents to stream them instead.
+    """
+    with metrics.span("load_data") as span:
+        documents = list(iter_documents(data))
+        span.set(documents=len(documents))
+    return documents
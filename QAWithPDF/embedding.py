@@ -1,64 +1,141 @@
-# Import VectorStoreIndex to create a vector-based index for semantic search
-from llama_index.core import VectorStoreIndex  
-from llama_index.core import Settings  # Global settings to replace ServiceContext
 from llama_index.embeddings.gemini import GeminiEmbedding  
 
 # Import helper functions to load documents and models
 from QAWithPDF.data_ingestion import load_data  
 from QAWithPDF.model_api import load_model  
 
+# Import the index lifecycle helper that reloads and incrementally updates storage/
+from QAWithPDF.index_storage import load_or_build_index, PERSIST_DIR
+
+# Import the per-index configuration that replaces global Settings
+from QAWithPDF.config import IndexConfig, CHUNK_SIZE, CHUNK_OVERLAP
+
+# Import the persistent embedding cache shared across indexes and sessions
+from QAWithPDF.embedding_cache import CachedEmbedding, get_embedding_cache
+
+# Import the request size of the embedding pipeline
+from QAWithPDF.embedding_pipeline import EMBED_BATCH_SIZE
+
 # Import sys to pass system exception info to custom exception
 import sys  
 
 # Import custom exception class for controlled error handling
 from exception import customexception  
 
-# Import logging for tracking process flow
-from logger import logging  
+# Import logging for tracking process flow, and metrics to time index builds
+from logger import logging, metrics  
 
 
-def download_gemini_embedding(model, document, google_api_key):
+def gemini_index_config(model, google_api_key, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     """
-    Downloads and initializes a Gemini Embedding model for vector embeddings.
+    Builds the per-index configuration for the Gemini LLM and cached Gemini embeddings.
 
     Parameters:
     - model: The Gemini LLM model object
-    - document: A list of document objects to be embedded
     - google_api_key: API key for Gemini model
+    - chunk_size: Maximum chunk size in tokens
+    - chunk_overlap: Overlap between consecutive chunks in tokens
 
     Returns:
-    - query_engine: A query engine built from the VectorStoreIndex for similarity queries
+    - config (IndexConfig): Configuration to pass to the index and its query engine
+    """
+    # Log the start of embedding creation
+    logging.info("Initializing Gemini Embedding model...")
+    
+    # Initialize the Gemini embedding model; each request carries up to EMBED_BATCH_SIZE texts
+    # (the default of 10 would split every pipeline batch into ten rate-limited requests)
+    gemini_embed_model = GeminiEmbedding(
+        model_name="models/embedding-001",
+        api_key=google_api_key,
+        embed_batch_size=EMBED_BATCH_SIZE
+    )
+    
+    # Serve repeated chunks from the on-disk cache instead of calling the API again
+    gemini_embed_model = CachedEmbedding(gemini_embed_model, get_embedding_cache())
+    
+    # Keep models and chunking per index instead of mutating global Settings
+    return IndexConfig(
+        llm=model,
+        embed_model=gemini_embed_model,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
+
+def build_gemini_index(model, document, google_api_key, use_async=False, quantization=None, persist_dir=PERSIST_DIR, config=None, on_progress=None):
+    """
+    Initializes the Gemini Embedding model and loads or builds the vector index.
+
+    Parameters:
+    - model: The Gemini LLM model object
+    - document: A list or iterator of document objects to be embedded (see iter_documents)
+    - google_api_key: API key for Gemini model
+    - use_async: Build a new index with concurrent, batched and rate-limited embedding calls
+    - quantization: Search 'float16' or 'int8' vector codes in memory (None keeps float32)
+    - persist_dir: Directory the index is persisted to and reloaded from
+    - config: Per-index configuration (defaults to gemini_index_config for `model`)
+    - on_progress: Called as on_progress(index, chunks) while the index is built (see load_or_build_index)
+
+    Returns:
+    - index: The VectorStoreIndex reflecting the given documents
     """
     try:
-        # Log the start of embedding creation
-        logging.info("Initializing Gemini Embedding model...")
+        # Bind models and chunking to this index only
+        if config is None:
+            config = gemini_index_config(model, google_api_key)
         
-        # Initialize the Gemini embedding model
-        gemini_embed_model = GeminiEmbedding(
-            model_name="models/embedding-001",
-            api_key=google_api_key
+        # Reload the persisted index (re-embedding only new or changed documents)
+        # or build and persist a fresh one if storage/ is empty
+        index = load_or_build_index(
+            document, config, persist_dir=persist_dir, use_async=use_async, quantization=quantization,
+            on_progress=on_progress
         )
         
-        # Configure global Settings (replaces deprecated ServiceContext)
-        Settings.llm = model                       # Set the LLM
-        Settings.embed_model = gemini_embed_model  # Set the embedding model
-        Settings.chunk_size = 800                  # Configure chunk size
-        Settings.chunk_overlap = 20                # Configure chunk overlap
-        
-        # Log progress
-        logging.info("Creating vector index from documents...")
+        # Log how much embedding traffic the cache saved
+        logging.info("Embedding cache stats: %s", get_embedding_cache().stats())
         
-        # Build a vector store index from the documents
-        index = VectorStoreIndex.from_documents(document, service_context=None)  # No ServiceContext needed
+        # Return the index
+        return index
+
+    except Exception as e:
+        # Raise a custom exception with detailed info if anything goes wrong
+        raise customexception(e, sys)
+
+
+def download_gemini_embedding(model, document, google_api_key, use_async=False, quantization=None, persist_dir=PERSIST_DIR, config=None, streaming=False):
+    """
+    Downloads and initializes a Gemini Embedding model for vector embeddings.
+
+    Parameters:
+    - model: The Gemini LLM model object
+    - document: A list or iterator of document objects to be embedded (see iter_documents)
+    - google_api_key: API key for Gemini model
+    - use_async: Build a new index with concurrent, batched and rate-limited embedding calls
+    - quantization: Search 'float16' or 'int8' vector codes in memory (None keeps float32)
+    - persist_dir: Directory the index is persisted to and reloaded from
+    - config: Per-index configuration (defaults to gemini_index_config for `model`)
+    - streaming: Build an engine whose responses stream tokens (see QAWithPDF.query.StreamedAnswer)
+
+    Returns:
+    - query_engine: A query engine built from the VectorStoreIndex for similarity queries
+    """
+    try:
+        # Bind models and chunking to this index only
+        if config is None:
+            config = gemini_index_config(model, google_api_key)
         
-        # Persist the index to disk so it can be reloaded later
-        index.storage_context.persist()
+        # Load or build the vector index
+        with metrics.span("build_index", persist_dir=persist_dir):
+            index = build_gemini_index(
+                model, document, google_api_key,
+                use_async=use_async, quantization=quantization, persist_dir=persist_dir, config=config
+            )
         
         # Log progress
         logging.info("Converting index to a query engine...")
         
         # Create a query engine for interacting with the index
-        query_engine = index.as_query_engine()
+        query_engine = config.query_engine(index, streaming=streaming)
         
         # Return the query engine
         return query_engine
@@ -0,0 +1,371 @@
+# Import os to create the cache directory
+import os
+
+# Import sqlite3 for the on-disk cache backend
+import sqlite3
+
+# Import hashlib to derive content-addressed cache keys
+import hashlib
+
+# Import threading so the cache can be shared between Streamlit sessions
+import threading
+
+# Import time to record when an entry was last used (for LRU eviction)
+import time
+
+# Import asyncio to await embeddings computed by another caller
+import asyncio
+
+# Import array to store embeddings as compact float32 blobs
+from array import array
+
+# Import the embedding base class and pydantic helpers used by llama_index
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+# Import SingleFlight to embed a text only once while identical requests are in flight
+from QAWithPDF.single_flight import SingleFlight
+
+# Import logging for tracking process flow, and metrics to count cache hits
+from logger import logging, metrics
+
+
+# Default location of the embedding cache, shared by every index and session
+EMBEDDING_CACHE_PATH = os.path.join("cache", "embeddings.sqlite")
+
+# Default maximum number of cached vectors (~150 MB for 768-dim float32 vectors)
+EMBEDDING_CACHE_MAX_ENTRIES = 50_000
+
+# Seconds before a hit refreshes an entry's last-used time; fresher hits stay read-only
+LAST_USED_REFRESH_SECONDS = 600
+
+
+def cache_key(model_name, text):
+    """
+    Builds the content-addressed key for a piece of text.
+
+    Parameters:
+    - model_name (str): Name of the embedding model that produced the vector
+    - text (str): The chunk or query text
+
+    Returns:
+    - str: Hex digest identifying the (model, text) pair
+    """
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Texts currently being embedded, shared by every CachedEmbedding in the process
+_embedding_flights = SingleFlight()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded LRU cache of embedding vectors backed by SQLite.
+
+    Vectors are stored as float32 blobs keyed by model name plus a hash of
+    the text, so identical chunks are embedded once no matter which
+    document, index or session they come from. Several processes may share
+    the file: hits only write when an entry's recency is older than
+    `refresh_seconds`, and eviction counts the rows actually in the table.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 refresh_seconds=LAST_USED_REFRESH_SECONDS):
+        """
+        Opens (or creates) the cache database.
+
+        Parameters:
+        - path (str): SQLite file holding the cache
+        - max_entries (int): Maximum number of vectors kept before evicting the least recently used
+        - refresh_seconds (float): Minimum age of a last-used time before a hit rewrites it
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh_seconds = refresh_seconds
+        self.hits = 0
+        self.misses = 0
+
+        # One connection shared across threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """
+        Looks up several keys at once.
+
+        Parameters:
+        - keys (list[str]): Cache keys to look up
+
+        Returns:
+        - dict: Mapping of key to embedding (list of floats) for every key found
+        """
+        if not keys:
+            return {}
+
+        found = {}
+        stale = []
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # Query in slices to stay below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = array("f", blob).tolist()
+                    if now - last_used > self.refresh_seconds:
+                        stale.append(key)
+
+            # Refresh recency only of entries not touched recently, so most hits never write
+            if stale:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in stale]
+                )
+                self._conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        metrics.count("embedding_cache_hits", hits)
+        metrics.count("embedding_cache_misses", len(keys) - hits)
+        return found
+
+    def put_many(self, items):
+        """
+        Stores several embeddings and evicts the least recently used entries if needed.
+
+        Parameters:
+        - items (dict): Mapping of key to embedding (list of floats)
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+
+            # Other processes may write to the same file, so count the rows actually stored
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def _count(self):
+        """
+        Returns the number of entries in the database (call with the lock held).
+        """
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        """
+        Reports cache effectiveness.
+
+        Returns:
+        - dict: Hit and miss counters, hit rate and current number of entries
+        """
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._count()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        """
+        Closes the underlying database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that consults an EmbeddingCache before calling the wrapped model.
+
+    Only texts missing from the cache are sent to the underlying model, in a
+    single batch call, and the results are written back to the cache. Texts
+    that another caller is already embedding are awaited rather than sent
+    again.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model, cache, **kwargs):
+        """
+        Wraps an embedding model with a cache.
+
+        Parameters:
+        - embed_model (BaseEmbedding): The model that computes embeddings on a cache miss
+        - cache (EmbeddingCache): The cache shared across indexes and sessions
+        """
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def cache(self):
+        """The EmbeddingCache backing this model."""
+        return self._cache
+
+    def _split(self, texts):
+        """
+        Resolves texts against the cache.
+
+        Returns:
+        - tuple: (keys for every text, cached vectors by key, texts that still need embedding)
+        """
+        keys = [cache_key(self.model_name, text) for text in texts]
+        cached = self._cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        return keys, cached, missing
+
+    def _store(self, owned, vectors):
+        """
+        Caches freshly computed vectors and hands them to callers waiting on the same texts.
+
+        Returns:
+        - dict: Mapping of key to embedding for the owned texts
+        """
+        computed = dict(zip(owned, vectors))
+
+        # Waiting callers get their vectors even if writing them to disk fails below
+        _embedding_flights.resolve(owned, computed)
+        self._put(computed)
+        return computed
+
+    def _put(self, items):
+        """
+        Writes vectors to the cache; a failed write (disk full, database locked) only loses the caching.
+        """
+        try:
+            self._cache.put_many(items)
+        except sqlite3.Error as e:
+            logging.info("Embedding cache write failed: %s", e)
+            metrics.count("embedding_cache_write_errors")
+
+    def _get_text_embeddings(self, texts):
+        keys, cached, missing = self._split(texts)
+
+        # Texts another session is embedding right now are awaited instead of sent again
+        owned, pending = _embedding_flights.claim(list(missing))
+        if owned:
+            try:
+                vectors = self._embed_model.get_text_embedding_batch([missing[key] for key in owned])
+                if len(vectors) != len(owned):
+                    raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(owned)} texts")
+            except BaseException as e:
+                _embedding_flights.resolve(owned, error=e)
+                raise
+            cached.update(self._store(owned, vectors))
+        for key, future in pending.items():
+            cached[key] = future.result()
+        return [cached[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts):
+        keys, cached, missing = self._split(texts)
+
+        # Texts another session is embedding right now are awaited instead of sent again
+        owned, pending = _embedding_flights.claim(list(missing))
+        if owned:
+            try:
+                vectors = await self._embed_model.aget_text_embedding_batch([missing[key] for key in owned])
+                if len(vectors) != len(owned):
+                    raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(owned)} texts")
+            except BaseException as e:
+                _embedding_flights.resolve(owned, error=e)
+                raise
+            cached.update(self._store(owned, vectors))
+        for key, future in pending.items():
+            cached[key] = await asyncio.wrap_future(future)
+        return [cached[key] for key in keys]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query):
+        # Query embeddings use a separate key space: some models embed queries differently
+        key = cache_key(self.model_name + ":query", query)
+        cached = self._cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self._embed_model.get_query_embedding(query)
+        self._put({key: vector})
+        return vector
+
+    async def _aget_query_embedding(self, query):
+        key = cache_key(self.model_name + ":query", query)
+        cached = self._cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = await self._embed_model.aget_query_embedding(query)
+        self._put({key: vector})
+        return vector
+
+
+# Process-wide cache instance, opened lazily on first use
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(path=EMBEDDING_CACHE_PATH):
+    """
+    Returns the process-wide embedding cache, creating it on first use.
+
+    Parameters:
+    - path (str): SQLite file holding the cache
+
+    Returns:
+    - EmbeddingCache: The shared cache instance
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            logging.info("Opening embedding cache at %s...", path)
+            _shared_cache = EmbeddingCache(path)
+        return _shared_cache
@@ -0,0 +1,420 @@
+# Import asyncio to keep several embedding batches in flight at once
+import asyncio
+
+# Import random to add jitter to retry backoff
+import random
+
+# Import time to measure throughput and refill the rate limiter
+import time
+
+# Import islice to consume streamed documents in bounded groups
+from itertools import islice
+
+# Import nullcontext for vector stores that have no lock of their own
+from contextlib import nullcontext
+
+# Import httpx (a llama_index dependency) to recognise network-level failures
+import httpx
+
+# Import the index class and the metadata mode used for embedding text
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+
+# Import logging for tracking process flow, and metrics to time each stage
+from logger import logging, metrics
+
+
+# Default number of chunks sent to the embedding API in one request
+EMBED_BATCH_SIZE = 100
+
+# Default number of batches awaiting a response at the same time
+MAX_IN_FLIGHT = 4
+
+# Default request budget (Gemini embedding quota is expressed per minute)
+REQUESTS_PER_MINUTE = 1500
+
+# Default number of retries per batch before the build is aborted
+MAX_RETRIES = 5
+
+# HTTP statuses worth retrying: request timeout, rate limit / quota, and server-side errors
+RETRYABLE_STATUS = (408, 429)
+
+# Default number of streamed documents (e.g. PDF pages) chunked and embedded together
+DOCUMENT_GROUP_SIZE = 32
+
+# Default number of chunked groups whose batches may be embedding while the oldest is inserted
+GROUPS_IN_FLIGHT = 4
+
+
+class TokenBucket:
+    """
+    Asynchronous token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`; each
+    request takes one token and waits when the bucket is empty.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Parameters:
+        - rate (float): Tokens added per second
+        - capacity (float): Maximum burst size (defaults to one second worth of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        """
+        Waits until `tokens` tokens are available and takes them.
+
+        Parameters:
+        - tokens (float): Number of tokens to take
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def is_transient(error):
+    """
+    Tells whether a failed embedding request is worth retrying.
+
+    Rate limits (429), request timeouts (408), server errors (5xx), timeouts
+    and dropped connections are transient. Anything else, such as an invalid
+    API key, an oversized input (400) or a programming error, fails the same
+    way on every attempt.
+
+    Parameters:
+    - error (BaseException): The exception raised by the embedding call
+
+    Returns:
+    - bool: True if the request should be retried
+    """
+    # HTTP clients expose the status on the response; Google API errors carry it as `code`
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError, httpx.TransportError))
+
+
+def make_batches(items, batch_size):
+    """
+    Splits a list into consecutive batches of at most `batch_size` items.
+
+    Parameters:
+    - items (list): Items to split
+    - batch_size (int): Maximum batch size
+
+    Returns:
+    - list[list]: The batches, in order
+    """
+    return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+
+async def _embed_batch(embed_model, texts, limiter, max_retries, backoff):
+    """
+    Embeds one batch, retrying transient failures with exponential backoff.
+
+    Returns:
+    - tuple: (list of embeddings, number of retries used)
+    """
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        try:
+            return await embed_model.aget_text_embedding_batch(texts), attempt
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not is_transient(e):
+                raise
+            delay = backoff * (2 ** (attempt - 1)) * (1 + random.random())
+            logging.info("Embedding batch failed (%s); retry %d in %.1fs", e, attempt, delay)
+            await asyncio.sleep(delay)
+
+
+async def embed_nodes_async(
+    nodes,
+    embed_model,
+    batch_size=EMBED_BATCH_SIZE,
+    max_in_flight=MAX_IN_FLIGHT,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    max_retries=MAX_RETRIES,
+    backoff=1.0,
+    limiter=None,
+    semaphore=None,
+):
+    """
+    Embeds nodes concurrently in rate-limited batches and stores the vectors on the nodes.
+
+    Batches that fail transiently are retried on their own, so a rate limit
+    or server error does not restart the whole build; other errors fail at
+    once. Nodes that already carry an embedding are skipped.
+    Batches never exceed the model's own `embed_batch_size`, so every batch is
+    exactly one API request and takes exactly one rate-limit token.
+    Any BaseEmbedding works as `embed_model`, including one that talks to a
+    local fake embedding server.
+
+    Parameters:
+    - nodes (list): Nodes to embed
+    - embed_model (BaseEmbedding): Model used to compute embeddings
+    - batch_size (int): Maximum number of chunks per request
+    - max_in_flight (int): Maximum number of concurrent requests
+    - requests_per_minute (float): Request rate limit
+    - max_retries (int): Retries per batch before giving up
+    - backoff (float): Initial retry delay in seconds
+    - limiter (TokenBucket): Shared rate limiter (defaults to a new one built from the limits above)
+    - semaphore (asyncio.Semaphore): Shared concurrency limit (defaults to a new one of `max_in_flight`)
+
+    Returns:
+    - dict: Chunk and batch counts, retries, elapsed seconds and chunks per second
+    """
+    # Larger batches would be split by the model into several requests behind the rate limiter's back
+    batch_size = min(batch_size, getattr(embed_model, "embed_batch_size", None) or batch_size)
+
+    pending = [node for node in nodes if node.embedding is None]
+    batches = make_batches(pending, batch_size)
+    if limiter is None:
+        limiter = TokenBucket(requests_per_minute / 60.0, capacity=max_in_flight)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_in_flight)
+    retries = 0
+
+    async def run(batch):
+        nonlocal retries
+        async with semaphore:
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+            embeddings, used = await _embed_batch(embed_model, texts, limiter, max_retries, backoff)
+            retries += used
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+
+    start = time.perf_counter()
+    with metrics.span("embed", chunks=len(pending), batches=len(batches)):
+        await asyncio.gather(*(run(batch) for batch in batches))
+    elapsed = time.perf_counter() - start
+    metrics.count("chunks_embedded", len(pending))
+    metrics.count("embedding_retries", retries)
+
+    return {
+        "chunks": len(pending),
+        "batches": len(batches),
+        "retries": retries,
+        "seconds": elapsed,
+        "chunks_per_second": len(pending) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def embed_nodes(nodes, embed_model):
+    """
+    Embeds nodes synchronously through the model's own batching and stores the vectors on the nodes.
+
+    Parameters:
+    - nodes (list): Nodes to embed; nodes that already carry an embedding are skipped
+    - embed_model (BaseEmbedding): Model used to compute embeddings
+    """
+    pending = [node for node in nodes if node.embedding is None]
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+    with metrics.span("embed", chunks=len(pending)):
+        embeddings = embed_model.get_text_embedding_batch(texts)
+    for node, embedding in zip(pending, embeddings):
+        node.embedding = embedding
+    metrics.count("chunks_embedded", len(pending))
+
+
+def insert_document_nodes(index, documents, nodes):
+    """
+    Inserts the embedded nodes of documents, replacing any earlier version of those documents.
+
+    Everything that needs the model happens before this call; the store
+    lock is held only while old nodes are removed, new ones inserted and
+    document hashes recorded, so concurrent queries never see a document
+    half-replaced and are not held up by embedding requests.
+
+    Parameters:
+    - index (VectorStoreIndex): Index receiving the nodes
+    - documents (list): The documents the nodes were chunked from
+    - nodes (list): Nodes that already carry embeddings
+    """
+    with getattr(index.vector_store, "lock", nullcontext()):
+        for doc in documents:
+            if index.docstore.get_document_hash(doc.doc_id) is not None:
+                index.delete_ref_doc(doc.doc_id, delete_from_docstore=True)
+
+        # Nodes already carry embeddings, so the index does not call the model again
+        index.insert_nodes(nodes)
+
+        # Record document hashes so the persisted index can be synchronised later
+        for doc in documents:
+            index.docstore.set_document_hash(doc.doc_id, doc.hash)
+
+
+def train_ann(index):
+    """
+    Trains or retrains the approximate index of the index's vector store once it has grown enough.
+
+    Parameters:
+    - index (VectorStoreIndex): Index whose vector store may carry an IVF index
+
+    Returns:
+    - bool: True if a new clustering was installed (always False for stores without one)
+    """
+    train = getattr(index.vector_store, "train_ann", None)
+    return bool(train is not None and train())
+
+
+async def index_documents_async(
+    index,
+    documents,
+    config,
+    group_size=DOCUMENT_GROUP_SIZE,
+    groups_in_flight=GROUPS_IN_FLIGHT,
+    on_progress=None,
+    **pipeline_kwargs
+):
+    """
+    Chunks documents and embeds them through the async pipeline into an existing index.
+
+    Documents are consumed in groups. A producer parses and chunks the next
+    group in a worker thread and starts embedding it straight away, while
+    the consumer inserts finished groups into the index in document order.
+    Up to `groups_in_flight` groups are queued at once, so batches of
+    successive groups overlap instead of each group waiting for the last
+    one to finish. All groups share one rate limiter and one concurrency
+    limit, so the request budget holds for the whole run. Documents already
+    in the index are replaced. After each group the store's IVF index is
+    (re)trained in a worker thread if the store has outgrown it.
+
+    Parameters:
+    - index (VectorStoreIndex): Index receiving the nodes (may already be serving queries)
+    - documents: A list or iterator of document objects to be indexed
+    - config (IndexConfig): Embedding model and chunking settings for this index
+    - group_size (int): Number of documents chunked together
+    - groups_in_flight (int): Number of chunked groups that may be embedding ahead of insertion
+    - on_progress (callable): Called as on_progress(index, chunks) after every group is inserted;
+      the index can already be queried at that point
+    - pipeline_kwargs: Tuning options forwarded to embed_nodes_async
+
+    Returns:
+    - dict: Chunk, batch and retry totals
+    """
+    node_parser = config.node_parser()
+    totals = {"chunks": 0, "batches": 0, "retries": 0}
+
+    # One limiter and one semaphore for the whole run, shared by every group's batches
+    requests_per_minute = pipeline_kwargs.pop("requests_per_minute", REQUESTS_PER_MINUTE)
+    max_in_flight = pipeline_kwargs.pop("max_in_flight", MAX_IN_FLIGHT)
+    limiter = TokenBucket(requests_per_minute / 60.0, capacity=max_in_flight)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    documents = iter(documents)
+    queue = asyncio.Queue(maxsize=groups_in_flight)
+
+    def next_group():
+        group = list(islice(documents, group_size))
+        if not group:
+            return group, []
+
+        # Chunk documents with the index's own node parser
+        with metrics.span("chunk", documents=len(group)) as span:
+            nodes = node_parser.get_nodes_from_documents(group)
+            span.set(chunks=len(nodes))
+        return group, nodes
+
+    async def produce():
+        error = None
+        try:
+            while True:
+                # Parse and chunk off the event loop so queued batches keep flowing meanwhile
+                group, nodes = await asyncio.to_thread(next_group)
+                if not group:
+                    break
+                task = asyncio.create_task(embed_nodes_async(
+                    nodes, config.embed_model, limiter=limiter, semaphore=semaphore, **pipeline_kwargs
+                ))
+                try:
+                    await queue.put((group, nodes, task))
+                except BaseException:
+                    task.cancel()
+                    raise
+        except Exception as e:
+            error = e
+
+        # None marks the end of the documents; an exception is re-raised by the consumer
+        await queue.put(error)
+
+    producer = asyncio.create_task(produce())
+    task = None
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            group, nodes, task = item
+            stats = await task
+            for key in totals:
+                totals[key] += stats[key]
+
+            # Queries against the partial index wait until vectors, docstore and hashes agree
+            insert_document_nodes(index, group, nodes)
+
+            if on_progress is not None:
+                on_progress(index, len(nodes))
+
+            # Cluster off the event loop; later groups keep embedding and queries keep running
+            await asyncio.to_thread(train_ann, index)
+    finally:
+        # On failure, stop parsing and cancel every group still embedding
+        producer.cancel()
+        pending = [producer]
+        if task is not None and not task.done():
+            task.cancel()
+            pending.append(task)
+        while not queue.empty():
+            item = queue.get_nowait()
+            if isinstance(item, tuple):
+                item[2].cancel()
+                pending.append(item[2])
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return totals
+
+
+async def build_index_async(documents, config, storage_context=None, on_progress=None, **pipeline_kwargs):
+    """
+    Builds a vector index by chunking documents and embedding them through the async pipeline.
+
+    Parameters:
+    - documents: A list or iterator of document objects to be indexed
+    - config (IndexConfig): Embedding model and chunking settings for this index
+    - storage_context (StorageContext): Where the index keeps its nodes and vectors
+    - on_progress (callable): Called as on_progress(index, chunks) after every group is inserted
+    - pipeline_kwargs: Grouping and tuning options forwarded to index_documents_async
+
+    Returns:
+    - index (VectorStoreIndex): Index containing the embedded nodes
+    """
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context, **config.index_kwargs())
+    start = time.perf_counter()
+    totals = await index_documents_async(index, documents, config, on_progress=on_progress, **pipeline_kwargs)
+
+    elapsed = time.perf_counter() - start
+    logging.info(
+        "Embedded %d chunks in %d batches (%d retries) in %.2fs: %.1f chunks/s end to end",
+        totals["chunks"], totals["batches"], totals["retries"], elapsed,
+        totals["chunks"] / elapsed if elapsed > 0 else 0.0
+    )
+
+    return index
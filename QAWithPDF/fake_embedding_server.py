@@ -0,0 +1,352 @@
+# Import json and zlib to serve deterministic embeddings over HTTP
+import json
+import zlib
+
+# Import math and time to check the request rate the server observed
+import math
+import time
+
+# Import threading to run the server next to the pipeline under test
+import threading
+
+# Import argparse to run the pipeline check from the command line
+import argparse
+
+# Import asyncio to drive the async embedding pipeline
+import asyncio
+
+# Import the standard library HTTP server used as the local fake endpoint
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Import httpx (a llama_index dependency) for the HTTP embedding client
+import httpx
+
+# Import the embedding interface and node type used by llama_index
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import Document, TextNode
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+# Import the pipeline under test and its defaults
+from QAWithPDF.embedding_pipeline import build_index_async, embed_nodes_async, EMBED_BATCH_SIZE
+
+# Import the per-index configuration used for the full build check
+from QAWithPDF.config import IndexConfig
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+class CheckFailed(Exception):
+    """
+    Raised when the embedding pipeline does not behave as a check expects.
+    """
+
+
+def _check(condition, message):
+    """
+    Raises CheckFailed with `message` unless `condition` holds (unlike assert, also under python -O).
+    """
+    if not condition:
+        raise CheckFailed(message)
+
+
+def fake_vector(text, dim):
+    """
+    Returns the deterministic vector the fake server assigns to a text.
+
+    Parameters:
+    - text (str): Text to embed
+    - dim (int): Vector dimension
+
+    Returns:
+    - list[float]: The embedding
+    """
+    seed = zlib.crc32(text.encode())
+    return [((seed >> (i % 24)) & 0xFF) / 255.0 for i in range(dim)]
+
+
+class FakeEmbeddingServer:
+    """
+    Local HTTP endpoint that imitates an embedding API.
+
+    POST /embed with {"texts": [...]} returns {"embeddings": [...]} after
+    `latency` seconds. Every `fail_every`-th request answers `fail_status`
+    (503 by default, like a transient server error) instead. The server records each request's time,
+    batch size and the peak number of requests served at once, so a test
+    can check batching, concurrency and rate limiting from the outside.
+    """
+
+    def __init__(self, latency=0.05, fail_every=0, dim=16, fail_status=503):
+        """
+        Parameters:
+        - latency (float): Seconds before every response
+        - fail_every (int): Answer every n-th request with HTTP 503 (0 disables failures)
+        - dim (int): Embedding dimension
+        - fail_status (int): HTTP status of the failing requests
+        """
+        self.latency = latency
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.dim = dim
+        self.requests = []
+        self.failures = 0
+        self.peak_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/embed"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["texts"]
+                with server._lock:
+                    server.requests.append((time.monotonic(), len(texts)))
+                    number = len(server.requests)
+                    server._in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server._in_flight)
+                try:
+                    time.sleep(server.latency)
+                    if server.fail_every and number % server.fail_every == 0:
+                        with server._lock:
+                            server.failures += 1
+                        self.send_response(server.fail_status)
+                        self.end_headers()
+                        return
+                    body = json.dumps({"embeddings": [fake_vector(text, server.dim) for text in texts]}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+
+class HTTPEmbedding(BaseEmbedding):
+    """
+    Embedding model that calls a FakeEmbeddingServer (or any endpoint with the same protocol).
+
+    `sent` records when every request was issued; arrival times at the
+    server include connection setup and are too jittery to check a rate
+    limit against.
+    """
+
+    url: str = Field(description="POST endpoint returning {'embeddings': [...]}")
+    _sent: list = PrivateAttr(default_factory=list)
+
+    @property
+    def sent(self):
+        """Monotonic times at which requests were issued."""
+        return self._sent
+
+    @classmethod
+    def class_name(cls):
+        return "HTTPEmbedding"
+
+    def _get_text_embeddings(self, texts):
+        self._sent.append(time.monotonic())
+        response = httpx.post(self.url, json={"texts": texts}, timeout=30)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def _aget_text_embeddings(self, texts):
+        self._sent.append(time.monotonic())
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.post(self.url, json={"texts": texts})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query):
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query):
+        return await self._aget_text_embedding(query)
+
+
+def check_rate(times, requests_per_minute, burst):
+    """
+    Checks that no window of requests was issued faster than the token bucket allows.
+
+    Parameters:
+    - times (list[float]): Monotonic time of every request
+    - requests_per_minute (float): Configured limit
+    - burst (int): Bucket capacity
+
+    Returns:
+    - float: Overall request rate observed (requests per second)
+    """
+    rate = requests_per_minute / 60.0
+    times = sorted(times)
+    for first in range(len(times)):
+        for last in range(first + burst, len(times)):
+            # Requests beyond the burst need at least one token interval each (with a little timer slack)
+            elapsed = times[last] - times[first]
+            allowed = (last - first + 1 - burst) / rate
+            _check(
+                elapsed >= allowed * 0.9 - 0.05,
+                f"{last - first + 1} requests in {elapsed:.2f}s exceed {requests_per_minute}/min"
+            )
+    span = times[-1] - times[0] if len(times) > 1 else 0.0
+    return (len(times) - 1) / span if span > 0 else 0.0
+
+
+def run_check(chunks=500, batch_size=EMBED_BATCH_SIZE, max_in_flight=4, requests_per_minute=600, latency=0.05, fail_every=4):
+    """
+    Embeds synthetic chunks through the async pipeline against a local fake server and checks its behaviour.
+
+    Verifies that every chunk gets the server's vector, that batches are
+    full-size, that failed requests are retried individually, that no more
+    than `max_in_flight` requests are open at once, that the request rate
+    respects the token bucket and that a client error (400) fails at once
+    without retries. Any violation raises CheckFailed.
+
+    Parameters:
+    - chunks (int): Number of chunks to embed
+    - batch_size (int): Chunks per request
+    - max_in_flight (int): Concurrent requests allowed
+    - requests_per_minute (float): Rate limit
+    - latency (float): Server latency per request in seconds
+    - fail_every (int): Server answers every n-th request with 503
+
+    Returns:
+    - dict: Pipeline stats plus the requests, failures and peak concurrency seen by the server
+    """
+    nodes = [TextNode(text=f"chunk {n} " * 20, id_=f"node-{n}") for n in range(chunks)]
+
+    with FakeEmbeddingServer(latency=latency, fail_every=fail_every) as server:
+        embed_model = HTTPEmbedding(url=server.url, embed_batch_size=batch_size)
+        stats = asyncio.run(embed_nodes_async(
+            nodes, embed_model, batch_size=batch_size, max_in_flight=max_in_flight,
+            requests_per_minute=requests_per_minute, backoff=0.05,
+        ))
+
+    expected_batches = math.ceil(chunks / batch_size)
+    _check(all(node.embedding == fake_vector(node.get_content(), server.dim) for node in nodes), "Wrong or missing embeddings")
+    _check(stats["batches"] == expected_batches, f"{stats['batches']} batches, expected {expected_batches}")
+    _check(len(server.requests) == expected_batches + server.failures, "Batches were split into extra requests")
+    _check(stats["retries"] == server.failures, f"{stats['retries']} retries for {server.failures} failures")
+    _check(server.peak_in_flight <= max_in_flight, f"{server.peak_in_flight} requests in flight, limit {max_in_flight}")
+    observed_rate = check_rate(embed_model.sent, requests_per_minute, burst=max_in_flight)
+
+    # A client error is not transient, so its batch must fail on the first request
+    with FakeEmbeddingServer(latency=latency, fail_every=1, fail_status=400) as rejecting:
+        try:
+            asyncio.run(embed_nodes_async(
+                [TextNode(text="rejected", id_="rejected")], HTTPEmbedding(url=rejecting.url), backoff=0.05
+            ))
+        except httpx.HTTPStatusError:
+            pass
+        else:
+            raise CheckFailed("A request answered with 400 did not fail the batch")
+    _check(len(rejecting.requests) == 1, f"A 400 response was retried {len(rejecting.requests) - 1} times")
+
+    result = {
+        **stats,
+        "requests": len(server.requests),
+        "failures": server.failures,
+        "peak_in_flight": server.peak_in_flight,
+        "requests_per_second": observed_rate,
+    }
+    logging.info("Embedding pipeline check passed: %s", result)
+    return result
+
+
+def run_build_check(documents=320, group_size=8, max_in_flight=4, requests_per_minute=120, latency=0.2):
+    """
+    Builds an index from one-chunk documents against a local fake server and checks that groups share one budget.
+
+    Each group is far smaller than a batch, so the build only keeps more
+    than one request open if batches of successive groups overlap. The
+    request rate is checked across the whole build, not per group.
+
+    Parameters:
+    - documents (int): Number of documents, one chunk each
+    - group_size (int): Documents chunked and embedded together
+    - max_in_flight (int): Concurrent requests allowed
+    - requests_per_minute (float): Rate limit for the whole build
+    - latency (float): Server latency per request in seconds
+
+    Returns:
+    - dict: Requests, peak concurrency and request rate seen by the server
+    """
+    docs = [Document(text=f"page {n} " * 20, doc_id=f"doc-{n}") for n in range(documents)]
+
+    with FakeEmbeddingServer(latency=latency) as server:
+        embed_model = HTTPEmbedding(url=server.url)
+        config = IndexConfig(embed_model=embed_model)
+        index = asyncio.run(build_index_async(
+            docs, config, group_size=group_size, max_in_flight=max_in_flight,
+            requests_per_minute=requests_per_minute, backoff=0.05,
+        ))
+
+    expected_requests = math.ceil(documents / group_size)
+    _check(len(index.docstore.docs) == documents, f"{len(index.docstore.docs)} chunks indexed, expected {documents}")
+    _check(len(server.requests) == expected_requests, f"{len(server.requests)} requests, expected {expected_requests}")
+    _check(1 < server.peak_in_flight <= max_in_flight, f"{server.peak_in_flight} requests in flight, limit {max_in_flight}")
+    observed_rate = check_rate(embed_model.sent, requests_per_minute, burst=max_in_flight)
+
+    result = {
+        "documents": documents,
+        "requests": len(server.requests),
+        "peak_in_flight": server.peak_in_flight,
+        "requests_per_second": observed_rate,
+    }
+    logging.info("Index build check passed: %s", result)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the async embedding pipeline against a local fake embedding server.")
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=600)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server seconds per request")
+    parser.add_argument("--fail-every", type=int, default=4, help="Answer every n-th request with 503 (0 = never)")
+    parser.add_argument("--build", action="store_true", help="Also build an index from many small document groups")
+    args = parser.parse_args()
+
+    result = run_check(
+        args.chunks, args.batch_size, args.max_in_flight, args.requests_per_minute, args.latency, args.fail_every
+    )
+    print(
+        f"OK: {result['chunks']} chunks in {result['requests']} requests ({result['failures']} retried), "
+        f"peak {result['peak_in_flight']} in flight, {result['chunks_per_second']:.0f} chunks/s"
+    )
+
+    if args.build:
+        result = run_build_check(max_in_flight=args.max_in_flight, latency=args.latency)
+        print(
+            f"OK: {result['documents']} documents in {result['requests']} requests, "
+            f"peak {result['peak_in_flight']} in flight, {result['requests_per_second']:.1f} requests/s"
+        )
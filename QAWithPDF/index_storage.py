@@ -0,0 +1,262 @@
+# Import os to check whether a persisted index already exists on disk
+import os
+
+# Import json to read and write the index manifest
+import json
+
+# Import sys to pass system exception info to custom exception
+import sys
+
+# Import asyncio to drive the concurrent embedding pipeline
+import asyncio
+
+# Import nullcontext for vector stores that have no lock of their own
+from contextlib import nullcontext
+
+# Import islice to synchronise streamed documents in bounded groups
+from itertools import islice
+
+# Import the index class and the helpers used to save and reload index data
+from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+
+# Import the concurrent, rate-limited index builder
+from QAWithPDF.embedding_pipeline import build_index_async, index_documents_async, embed_nodes, insert_document_nodes
+from QAWithPDF.embedding_pipeline import train_ann, DOCUMENT_GROUP_SIZE
+
+# Import the binary, memory-mapped vector store
+from QAWithPDF.vector_store import NumpyVectorStore, load_vector_store
+
+# Import the BM25 inverted index kept alongside the vectors
+from QAWithPDF.lexical import BM25Index
+
+# Import custom exception class for controlled error handling
+from exception import customexception
+
+# Import logging for tracking process flow, and metrics to time each stage
+from logger import logging, metrics
+
+
+# Directory where the index (docstore, vector store, index store) is persisted
+PERSIST_DIR = "storage"
+
+# File written by the docstore; its presence means a previous index can be reloaded
+DOCSTORE_FILE = "docstore.json"
+
+# File recording the settings the persisted index was built with
+MANIFEST_FILE = "index_manifest.json"
+
+
+def index_exists(config, persist_dir=PERSIST_DIR):
+    """
+    Checks whether a reusable index is available in the given directory.
+
+    An index only counts as reusable if it was built with the current
+    chunking and embedding settings; otherwise its nodes would not match
+    what a fresh build produces.
+
+    Parameters:
+    - config (IndexConfig): Settings the index is expected to have been built with
+    - persist_dir (str): Directory the index was persisted to
+
+    Returns:
+    - bool: True if the directory holds a compatible docstore that can be reloaded
+    """
+    if not os.path.exists(os.path.join(persist_dir, DOCSTORE_FILE)):
+        return False
+
+    manifest_path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        # Indexes persisted before the manifest existed are trusted as-is
+        return True
+
+    with open(manifest_path) as f:
+        return json.load(f) == config.signature()
+
+
+def write_manifest(config, persist_dir=PERSIST_DIR):
+    """
+    Records the index settings next to the persisted index.
+
+    Parameters:
+    - config (IndexConfig): Settings the index was built with
+    - persist_dir (str): Directory the index was persisted to
+    """
+    with open(os.path.join(persist_dir, MANIFEST_FILE), "w") as f:
+        json.dump(config.signature(), f)
+
+
+def sync_index(index, documents, config, use_async=False, on_progress=None):
+    """
+    Brings a reloaded index in line with the current set of documents.
+
+    Documents are matched on their id and compared using the `doc_hash`
+    recorded in the docstore, so only new or modified documents are
+    re-chunked and re-embedded. Documents are streamed; new and modified
+    ones are chunked and embedded in groups outside the vector store's
+    lock, which is only held to swap their nodes in, so an index that is
+    already serving queries keeps answering while it is synchronised.
+    Documents that are no longer present are removed together with their nodes.
+
+    Parameters:
+    - index (VectorStoreIndex): The index loaded from storage
+    - documents: A list or iterator of document objects representing the current inputs
+    - config (IndexConfig): Embedding model and chunking settings of the index
+    - use_async (bool): Embed through the concurrent, rate-limited batch pipeline
+    - on_progress (callable): Called as on_progress(index, chunks) after every group is inserted
+
+    Returns:
+    - dict: Lists of document ids under the keys 'added', 'changed' and 'deleted'
+    """
+    docstore = index.docstore
+    changes = {"added": [], "changed": [], "deleted": []}
+
+    # Ids of every incoming document, so deletions can be detected afterwards
+    incoming = set()
+
+    def modified():
+        for doc in documents:
+            incoming.add(doc.doc_id)
+
+            # Hash recorded when the document was last indexed (None if never seen)
+            stored_hash = docstore.get_document_hash(doc.doc_id)
+            if stored_hash is None:
+                changes["added"].append(doc.doc_id)
+                yield doc
+            elif stored_hash != doc.hash:
+                changes["changed"].append(doc.doc_id)
+                yield doc
+
+    if use_async:
+        asyncio.run(index_documents_async(index, modified(), config, on_progress=on_progress))
+    else:
+        node_parser = config.node_parser()
+        pending = modified()
+        while True:
+            group = list(islice(pending, DOCUMENT_GROUP_SIZE))
+            if not group:
+                break
+            with metrics.span("chunk", documents=len(group)) as span:
+                nodes = node_parser.get_nodes_from_documents(group)
+                span.set(chunks=len(nodes))
+            embed_nodes(nodes, config.embed_model)
+            insert_document_nodes(index, group, nodes)
+            if on_progress is not None:
+                on_progress(index, len(nodes))
+            train_ann(index)
+
+    # Any reference document left in the index but not in the inputs was deleted
+    for ref_doc_id in list(index.ref_doc_info.keys()):
+        if ref_doc_id not in incoming:
+            with getattr(index.vector_store, "lock", nullcontext()):
+                index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            changes["deleted"].append(ref_doc_id)
+
+    return changes
+
+
+def load_or_build_index(documents, config, persist_dir=PERSIST_DIR, use_async=False, quantization=None, on_progress=None):
+    """
+    Loads the persisted index when available, otherwise builds a new one.
+
+    A reloaded index is synchronised with the given documents so that only
+    added or changed documents hit the embedding model. The index is only
+    written back to disk when something actually changed.
+
+    Parameters:
+    - documents: A list or iterator of document objects to be indexed
+    - config (IndexConfig): Embedding model and chunking settings for this index
+    - persist_dir (str): Directory the index is persisted to
+    - use_async (bool): Embed new or changed documents through the concurrent batched embedding pipeline
+    - quantization (str): Keep vectors in memory as 'float16' or 'int8' codes (None for float32)
+    - on_progress (callable): Called as on_progress(index, chunks) as soon as a persisted index is
+      loaded (before it is synchronised) and after every group embedded by the async builder
+
+    Returns:
+    - index (VectorStoreIndex): An index that reflects the given documents
+    """
+    try:
+        if index_exists(config, persist_dir):
+            # Log progress
+            logging.info("Loading persisted vector index from %s...", persist_dir)
+
+            # Reload the docstore and index store from disk and memory-map the vectors
+            with metrics.span("load_index") as span:
+                storage_context = StorageContext.from_defaults(
+                    persist_dir=persist_dir,
+                    vector_store=load_vector_store(persist_dir, ann=config.ann_index(), quantization=quantization, lexical=BM25Index()),
+                )
+                index = load_index_from_storage(storage_context, **config.index_kwargs())
+                span.set(chunks=len(index.docstore.docs))
+
+            # Indexes persisted before the keyword index existed get one built from their docstore
+            lexical = storage_context.vector_store.lexical
+            if not len(lexical) and index.docstore.docs:
+                logging.info("Building BM25 index for %d persisted chunks...", len(index.docstore.docs))
+                lexical.add_nodes(index.docstore.docs.values())
+                lexical.save(persist_dir)
+
+            # The persisted index can answer questions while it is synchronised and written back
+            if on_progress is not None:
+                on_progress(index, 0)
+
+            # Re-embed only what differs from the persisted state
+            with metrics.span("sync") as span:
+                changes = sync_index(index, documents, config, use_async=use_async, on_progress=on_progress)
+                span.set(**{key: len(ids) for key, ids in changes.items()})
+            logging.info(
+                "Index synchronised: %d added, %d changed, %d deleted",
+                len(changes["added"]), len(changes["changed"]), len(changes["deleted"])
+            )
+
+            # An index persisted before it was large enough for IVF is trained now
+            trained = train_ann(index)
+
+            # Nothing to write back if the inputs are unchanged
+            if not any(changes.values()):
+                if trained:
+                    index.storage_context.persist(persist_dir=persist_dir)
+                return index
+        else:
+            # Log progress
+            logging.info("Creating vector index from documents...")
+
+            # Keep embeddings in a contiguous float32 matrix instead of JSON
+            storage_context = StorageContext.from_defaults(
+                vector_store=NumpyVectorStore(ann=config.ann_index(), quantization=quantization, lexical=BM25Index())
+            )
+
+            if use_async:
+                # Embed batches concurrently under a rate limit while later documents are still parsed
+                index = asyncio.run(
+                    build_index_async(documents, config, storage_context=storage_context, on_progress=on_progress)
+                )
+            else:
+                documents = list(documents)
+
+                # Chunk the documents with the index's node parser
+                with metrics.span("chunk", documents=len(documents)) as span:
+                    nodes = config.node_parser().get_nodes_from_documents(documents)
+                    span.set(chunks=len(nodes))
+
+                # Build a vector store index from the chunks (embedding them one batch at a time)
+                with metrics.span("embed", chunks=len(nodes)):
+                    index = VectorStoreIndex(nodes, storage_context=storage_context, **config.index_kwargs())
+                metrics.count("chunks_embedded", len(nodes))
+
+                # Record document hashes so the persisted index can be synchronised later
+                for doc in documents:
+                    index.docstore.set_document_hash(doc.doc_id, doc.hash)
+
+        # Train the IVF index of a store that has outgrown it before writing it out
+        train_ann(index)
+
+        # Persist the index to disk so it can be reloaded later
+        with metrics.span("persist", chunks=len(index.docstore.docs)):
+            index.storage_context.persist(persist_dir=persist_dir)
+            write_manifest(config, persist_dir)
+
+        return index
+
+    except Exception as e:
+        # Raise a custom exception with detailed info if anything goes wrong
+        raise customexception(e, sys)
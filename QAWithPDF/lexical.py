@@ -0,0 +1,268 @@
+# Import os and json to persist the inverted index next to the vector store
+import os
+import json
+
+# Import re to split text into searchable terms
+import re
+
+# Import math for BM25's inverse document frequency
+import math
+
+# Import threading so the index can be searched while a background build adds to it
+import threading
+
+# Import Counter to count term frequencies per chunk
+from collections import Counter
+
+# Import the retriever interface and node types used by llama_index
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# File holding the BM25 inverted index, next to the vector store
+BM25_FILE = "bm25_index.json"
+
+# BM25 term-frequency saturation and length normalization parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Constant of reciprocal rank fusion; larger values flatten the rank weights
+RRF_K = 60
+
+# Identifiers, numbers and words; keeps names like "load_data" or "E1234" whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms.
+
+    Parameters:
+    - text (str): Chunk or query text
+
+    Returns:
+    - list[str]: Terms in order of appearance
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index over chunk text, scored with Okapi BM25.
+
+    Postings map every term to the chunks containing it and their term
+    frequency, so a query only touches the chunks that share a term with
+    it and needs no embedding. Chunks are added and removed individually,
+    which keeps the index in step with the vector store it belongs to.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        """
+        Parameters:
+        - k1 (float): Term-frequency saturation
+        - b (float): Strength of document-length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = {}
+        # Distinct terms of every chunk, so removing it only touches its own postings
+        self.terms = {}
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, node_id, text):
+        """
+        Indexes one chunk, replacing an earlier version with the same id.
+
+        Parameters:
+        - node_id (str): Id of the chunk's node
+        - text (str): Chunk text
+        """
+        with self._lock:
+            if node_id in self.lengths:
+                self.remove([node_id])
+            terms = tokenize(text)
+            counts = Counter(terms)
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[node_id] = count
+            self.terms[node_id] = list(counts)
+            self.lengths[node_id] = len(terms)
+            self.total_length += len(terms)
+            self.dirty = True
+
+    def add_nodes(self, nodes):
+        """
+        Indexes several nodes.
+
+        Parameters:
+        - nodes (iterable[BaseNode]): Nodes carrying their text
+        """
+        for node in nodes:
+            self.add(node.node_id, node.get_content())
+
+    def remove(self, node_ids):
+        """
+        Removes chunks from the index.
+
+        Parameters:
+        - node_ids (iterable[str]): Ids of the nodes to remove
+        """
+        with self._lock:
+            for node_id in node_ids:
+                if node_id not in self.lengths:
+                    continue
+                for term in self.terms.pop(node_id):
+                    posting = self.postings[term]
+                    del posting[node_id]
+                    if not posting:
+                        del self.postings[term]
+                self.total_length -= self.lengths.pop(node_id)
+                self.dirty = True
+
+    def search(self, query, k):
+        """
+        Scores chunks sharing at least one term with the query.
+
+        Parameters:
+        - query (str): Query text
+        - k (int): Number of results
+
+        Returns:
+        - list[tuple]: (node_id, score) pairs, best first
+        """
+        with self._lock:
+            if not self.lengths:
+                return []
+            n_docs = len(self.lengths)
+            avg_length = self.total_length / n_docs or 1.0
+            scores = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for node_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[node_id] / avg_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, persist_dir):
+        """
+        Writes the index to `persist_dir`.
+
+        Parameters:
+        - persist_dir (str): Directory the vector store is persisted to
+        """
+        with self._lock:
+            path = os.path.join(persist_dir, BM25_FILE)
+            with open(path + ".tmp", "w") as f:
+                json.dump({"k1": self.k1, "b": self.b, "postings": self.postings, "lengths": self.lengths}, f)
+            os.replace(path + ".tmp", path)
+            self.dirty = False
+
+    def load(self, persist_dir):
+        """
+        Restores the index from `persist_dir` if it was persisted there.
+
+        Parameters:
+        - persist_dir (str): Directory the vector store is persisted to
+
+        Returns:
+        - bool: True if an index was loaded
+        """
+        with self._lock:
+            path = os.path.join(persist_dir, BM25_FILE)
+            if not os.path.exists(path):
+                return False
+            with open(path) as f:
+                data = json.load(f)
+            self.k1, self.b = data["k1"], data["b"]
+            self.postings = data["postings"]
+            self.lengths = data["lengths"]
+            self.terms = {}
+            for term, posting in self.postings.items():
+                for node_id in posting:
+                    self.terms.setdefault(node_id, []).append(term)
+            self.total_length = sum(self.lengths.values())
+            self.dirty = False
+            return True
+
+
+class BM25Retriever(BaseRetriever):
+    """
+    Retrieves chunks from a BM25Index; no embedding call is made at query time.
+    """
+
+    def __init__(self, lexical, docstore, similarity_top_k):
+        """
+        Parameters:
+        - lexical (BM25Index): The inverted index
+        - docstore: Docstore holding the node text
+        - similarity_top_k (int): Number of chunks to retrieve
+        """
+        super().__init__()
+        self._lexical = lexical
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle):
+        hits = self._lexical.search(query_bundle.query_str, self._similarity_top_k)
+        # Nodes of an index still being built may not have reached the docstore yet
+        nodes = [(self._docstore.get_node(node_id, raise_error=False), score) for node_id, score in hits]
+        return [NodeWithScore(node=node, score=score) for node, score in nodes if node is not None]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses dense and BM25 results with reciprocal rank fusion.
+
+    A chunk's fused score is the sum of 1 / (RRF_K + rank) over both result
+    lists, so chunks found by both retrievers rise to the top and exact
+    keyword matches (ids, function names, error codes) are not lost when
+    their embedding is only loosely similar to the question.
+    """
+
+    def __init__(self, dense, lexical, similarity_top_k, rrf_k=RRF_K):
+        """
+        Parameters:
+        - dense (BaseRetriever): Vector retriever
+        - lexical (BM25Retriever): Keyword retriever
+        - similarity_top_k (int): Number of fused chunks to return
+        - rrf_k (int): Reciprocal rank fusion constant
+        """
+        super().__init__()
+        self._dense = dense
+        self._lexical = lexical
+        self._similarity_top_k = similarity_top_k
+        self._rrf_k = rrf_k
+
+    def _fuse(self, dense_hits, lexical_hits):
+        """
+        Combines two ranked result lists into one.
+        """
+        fused = {}
+        for hits in (dense_hits, lexical_hits):
+            for rank, hit in enumerate(hits):
+                score, _ = fused.get(hit.node.node_id, (0.0, hit.node))
+                fused[hit.node.node_id] = (score + 1.0 / (self._rrf_k + rank + 1), hit.node)
+        ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:self._similarity_top_k]
+        logging.info(
+            "Hybrid retrieval: %d dense + %d lexical hits fused into %d",
+            len(dense_hits), len(lexical_hits), len(ranked)
+        )
+        return [NodeWithScore(node=node, score=score) for score, node in ranked]
+
+    def _retrieve(self, query_bundle):
+        return self._fuse(self._dense.retrieve(query_bundle), self._lexical.retrieve(query_bundle))
+
+    async def _aretrieve(self, query_bundle):
+        dense_hits = await self._dense.aretrieve(query_bundle)
+        return self._fuse(dense_hits, self._lexical.retrieve(query_bundle))
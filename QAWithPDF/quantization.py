@@ -0,0 +1,281 @@
+# Import os to build file paths inside the persist directory
+import os
+
+# Import time to measure search latency for the benchmark
+import time
+
+# Import argparse to expose the benchmark on the command line
+import argparse
+
+# Import numpy for compact vector codes and vectorized scoring
+import numpy as np
+
+# Import the shared top-k helper
+from QAWithPDF.ann import top_k
+
+
+# Supported compact representations
+QUANTIZATION_MODES = ("float16", "int8")
+
+# Number of rows converted to float32 at a time while scoring codes
+SCORE_BLOCK_SIZE = 16384
+
+# Shortlist size as a multiple of top-k for full-precision rescoring
+RESCORE_FACTOR = 4
+
+# Bytes per dimension of a Python float inside a list (8-byte pointer + 24-byte float object)
+PYTHON_FLOAT_BYTES = 32
+
+
+def quantize(matrix, mode):
+    """
+    Encodes float32 rows into a compact representation.
+
+    float16 halves the size; int8 stores one byte per dimension plus a
+    per-vector scale (max absolute value / 127).
+
+    Parameters:
+    - matrix (np.ndarray): float32 rows
+    - mode (str): 'float16' or 'int8'
+
+    Returns:
+    - tuple: (codes, scales) where scales is None for float16
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == "float16":
+        return matrix.astype(np.float16), None
+    if mode == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def quantize_blocks(matrix, mode):
+    """
+    Encodes a (possibly memory-mapped) matrix block by block to bound temporary memory.
+
+    Parameters:
+    - matrix (np.ndarray): float32 rows
+    - mode (str): 'float16' or 'int8'
+
+    Returns:
+    - tuple: (codes, scales) for all rows
+    """
+    codes, scales = [], []
+    for start in range(0, len(matrix), SCORE_BLOCK_SIZE):
+        block_codes, block_scales = quantize(matrix[start:start + SCORE_BLOCK_SIZE], mode)
+        codes.append(block_codes)
+        scales.append(block_scales)
+    if not codes:
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        return quantize(np.zeros((0, dim), np.float32), mode)
+    return np.concatenate(codes), (np.concatenate(scales) if mode == "int8" else None)
+
+
+def approximate_scores(codes, scales, query_vector):
+    """
+    Scores every row against a query using the compact codes.
+
+    Parameters:
+    - codes (np.ndarray): float16 or int8 rows
+    - scales (np.ndarray): Per-row scales for int8 codes, else None
+    - query_vector (np.ndarray): float32 unit-length query
+
+    Returns:
+    - np.ndarray: float32 approximate similarity per row
+    """
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+        block = codes[start:start + SCORE_BLOCK_SIZE].astype(np.float32)
+        scores[start:start + len(block)] = block @ query_vector
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def quantized_search(codes, scales, matrix, query_vector, mask, k, rescore_factor=RESCORE_FACTOR, rows=None):
+    """
+    Finds top-k rows using the compact codes, then rescores a shortlist at full precision.
+
+    Parameters:
+    - codes (np.ndarray): Compact rows
+    - scales (np.ndarray): Per-row int8 scales, or None
+    - matrix (np.ndarray): Full-precision rows (usually memory-mapped; only shortlisted rows are read)
+    - query_vector (np.ndarray): float32 unit-length query
+    - mask (np.ndarray): Boolean mask of rows that may be returned
+    - k (int): Number of results
+    - rescore_factor (int): Shortlist size as a multiple of k (0 disables rescoring)
+    - rows (np.ndarray): Candidate rows to score (e.g. probed by an IVF index); None scores every row
+
+    Returns:
+    - tuple: (row numbers, similarities), best first
+    """
+    if rows is None:
+        scores = approximate_scores(codes, scales, query_vector)
+    else:
+        scores = approximate_scores(codes[rows], scales[rows] if scales is not None else None, query_vector)
+        mask = mask[rows]
+    scores = np.where(mask, scores, -np.inf)
+    shortlist = top_k(scores, max(k, k * rescore_factor))
+    shortlist = shortlist[np.isfinite(scores[shortlist])]
+    approximate = scores[shortlist]
+    if rows is not None:
+        shortlist = rows[shortlist]
+
+    if rescore_factor:
+        # Read only the shortlisted rows (in file order) from the full-precision matrix
+        shortlist = np.sort(shortlist)
+        exact = np.asarray(matrix[shortlist]) @ query_vector
+        order = top_k(exact, k)
+        return shortlist[order], exact[order]
+
+    return shortlist[:k], approximate[:k]
+
+
+def codes_path(persist_dir, mode):
+    """
+    Path of the persisted codes for a quantization mode.
+    """
+    return os.path.join(persist_dir, f"vector_store.{mode}.npz")
+
+
+def save_codes(persist_dir, mode, codes, scales):
+    """
+    Writes codes (and int8 scales) next to the vector store, removing codes of other modes.
+    """
+    remove_codes(persist_dir, keep=mode)
+    path = codes_path(persist_dir, mode)
+    tmp = path + ".tmp.npz"
+    if scales is None:
+        np.savez(tmp, codes=codes)
+    else:
+        np.savez(tmp, codes=codes, scales=scales)
+    os.replace(tmp, path)
+
+
+def remove_codes(persist_dir, keep=None):
+    """
+    Deletes persisted codes of every mode except `keep`.
+
+    Codes written by an earlier configuration would otherwise be read back
+    against a matrix that has changed since.
+
+    Parameters:
+    - persist_dir (str): Directory the store was persisted to
+    - keep (str): Mode whose codes are left in place, or None to remove all
+    """
+    for mode in QUANTIZATION_MODES:
+        path = codes_path(persist_dir, mode)
+        if mode != keep and os.path.exists(path):
+            os.remove(path)
+
+
+def load_codes(persist_dir, mode, rows=None):
+    """
+    Reads persisted codes into memory.
+
+    Parameters:
+    - persist_dir (str): Directory the store was persisted to
+    - mode (str): 'float16' or 'int8'
+    - rows (int): Number of rows in the store; codes for a different number are stale and ignored
+
+    Returns:
+    - tuple: (codes, scales), or None if no usable codes were persisted for this mode
+    """
+    path = codes_path(persist_dir, mode)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        codes, scales = data["codes"], (data["scales"] if "scales" in data else None)
+    if rows is not None and len(codes) != rows:
+        return None
+    return codes, scales
+
+
+def benchmark(matrix, k=5, n_queries=200, rescore_factor=RESCORE_FACTOR, ivf=False, seed=0):
+    """
+    Compares memory, recall@k and latency of each quantization mode against float32.
+
+    Every configuration is measured through NumpyVectorStore.query, so the
+    numbers include the store's own branch selection and overhead.
+
+    Parameters:
+    - matrix (np.ndarray): Unit-length float32 rows
+    - k (int): Number of neighbours compared
+    - n_queries (int): Number of queries (stored vectors with added noise)
+    - rescore_factor (int): Shortlist multiple used for rescoring
+    - ivf (bool): Also measure every mode behind an IVF index
+    - seed (int): Random seed
+
+    Returns:
+    - list[dict]: One row per configuration
+    """
+    # Imported here because the vector store itself imports this module
+    from llama_index.core.vector_stores.types import VectorStoreQuery
+    from QAWithPDF.vector_store import NumpyVectorStore
+    from QAWithPDF.ann import IVFIndex
+
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n, dim = matrix.shape
+    ids = [str(row) for row in range(n)]
+
+    queries = matrix[rng.choice(n, size=n_queries)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = [VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=k) for q in queries]
+
+    # Ground truth from a plain exact scan
+    truth = [set(top_k(matrix @ np.asarray(q.query_embedding, np.float32), k).tolist()) for q in queries]
+
+    report = [
+        {"index": "-", "mode": "python floats", "rescore": False, "memory_mb": n * dim * PYTHON_FLOAT_BYTES / 2**20,
+         "recall_at_k": 1.0, "latency_ms": None},
+    ]
+
+    configurations = [(None, 0)] + [(mode, factor) for mode in QUANTIZATION_MODES for factor in (0, rescore_factor)]
+    for index in ("exact", "ivf") if ivf else ("exact",):
+        for mode, factor in configurations:
+            ann = IVFIndex(min_train_size=0, seed=seed) if index == "ivf" else None
+            store = NumpyVectorStore(matrix=matrix, ids=ids, ann=ann, quantization=mode, rescore_factor=factor)
+            # Train the IVF index up front, as a build would, and warm up the query path
+            store.train_ann()
+            store.query(queries[0])
+
+            start = time.perf_counter()
+            found = [store.query(q).ids for q in queries]
+            latency_ms = (time.perf_counter() - start) * 1000 / n_queries
+            recall = np.mean([len(truth[i] & {int(row) for row in rows}) / k for i, rows in enumerate(found)])
+
+            memory = matrix.nbytes if mode is None else store._codes.nbytes + (
+                store._scales.nbytes if store._scales is not None else 0
+            )
+            report.append({"index": index, "mode": mode or "float32", "rescore": bool(factor),
+                           "memory_mb": memory / 2**20, "recall_at_k": float(recall), "latency_ms": latency_ms})
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark float16/int8 vector storage against float32.")
+    parser.add_argument("--persist-dir", default="storage", help="Storage directory holding vector_store.npy")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random 768-dim vectors instead")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ivf", action="store_true", help="Also measure every mode behind an IVF index")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data = np.random.default_rng(0).normal(size=(args.synthetic, 768)).astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+    else:
+        data = np.load(os.path.join(args.persist_dir, "vector_store.npy"))
+
+    baseline = data.nbytes / 2**20
+    print(f"{'index':<7}{'mode':<15}{'rescore':>8}{'memory MB':>12}{'vs f32':>8}{'recall@' + str(args.k):>11}{'latency ms':>12}")
+    for row in benchmark(data, k=args.k, n_queries=args.queries, ivf=args.ivf):
+        latency = f"{row['latency_ms']:.3f}" if row["latency_ms"] is not None else "-"
+        print(f"{row['index']:<7}{row['mode']:<15}{str(row['rescore']):>8}{row['memory_mb']:>12.2f}"
+              f"{baseline / row['memory_mb']:>7.1f}x{row['recall_at_k']:>11.3f}{latency:>12}")
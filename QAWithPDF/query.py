@@ -0,0 +1,247 @@
+# Import time to measure time-to-first-token and total generation time
+import time
+
+# Import sys to pass system exception info to custom exception
+import sys
+
+# Import asyncio to answer several questions concurrently
+import asyncio
+
+# Import nullcontext to run without a concurrency cap when none is given
+from contextlib import nullcontext
+
+# Import QueryBundle to run retrieval and synthesis as separate steps
+from llama_index.core import QueryBundle
+
+# Import SingleFlight and question normalization to answer identical questions in flight only once
+from QAWithPDF.single_flight import SingleFlight
+from QAWithPDF.answer_cache import normalize_question
+
+# Import custom exception class for controlled error handling
+from exception import customexception
+
+# Import logging for tracking process flow, and metrics to time retrieval and synthesis
+from logger import logging, metrics
+
+
+# Default number of answers synthesized by the LLM at the same time
+MAX_CONCURRENT_QUESTIONS = 4
+
+# Questions currently being answered, shared by every session in the process
+_query_flights = SingleFlight()
+
+
+def query_key(index_key, question):
+    """
+    Identifies identical questions about the same index.
+
+    Parameters:
+    - index_key (str): Identifies the index (e.g. content hash of the upload)
+    - question (str): The question
+
+    Returns:
+    - tuple: Key under which concurrent identical questions are coalesced
+    """
+    return (index_key, normalize_question(question))
+
+
+class StreamedAnswer:
+    """
+    Streams the answer of a streaming query engine token by token and times it.
+
+    Iterate over the object to receive tokens as they arrive. Afterwards
+    `text` holds the full answer, `time_to_first_token` the seconds until
+    the first token and `total_time` the seconds until the last one, both
+    measured from the moment the question was submitted.
+
+    When a `key` is given and the same question is already being answered
+    for another session, the answer of that call is awaited and yielded
+    at once instead of calling the LLM again.
+    """
+
+    def __init__(self, query_engine, question, key=None):
+        """
+        Parameters:
+        - query_engine: A query engine created with streaming=True
+        - question (str): The question to answer
+        - key: Coalesces concurrent identical questions (see query_key)
+        """
+        self.query_engine = query_engine
+        self.question = question
+        self.key = key
+        self.text = ""
+        self.time_to_first_token = None
+        self.total_time = None
+        self.retrieval_time = None
+        self.response = None
+
+    def __iter__(self):
+        owned = {}
+        try:
+            start = time.perf_counter()
+
+            if self.key is not None:
+                owned, pending = _query_flights.claim([self.key])
+                if pending:
+                    # Another session is answering the same question: share its answer
+                    shared = pending[self.key].result()
+                    if shared["error"] is not None:
+                        raise RuntimeError(shared["error"])
+                    self.text = shared["answer"]
+                    self.time_to_first_token = self.total_time = time.perf_counter() - start
+                    logging.info("Shared in-flight answer after %.2fs", self.total_time)
+                    yield self.text
+                    return
+
+            # Retrieve first, then stream generation, so both stages are timed separately
+            query_bundle = QueryBundle(self.question)
+            with metrics.span("retrieve") as span:
+                nodes = self.query_engine.retrieve(query_bundle)
+                span.set(chunks=len(nodes))
+            self.retrieval_time = time.perf_counter() - start
+
+            self.response = self.query_engine.synthesize(query_bundle, nodes)
+            tokens = getattr(self.response, "response_gen", None)
+            if tokens is None:
+                # Non-streaming engines (or empty retrievals) return the full answer at once
+                tokens = [str(self.response)]
+
+            for token in tokens:
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - start
+                self.text += token
+                yield token
+
+            self.total_time = time.perf_counter() - start
+            metrics.observe("synthesize", (self.total_time - self.retrieval_time) * 1000, streamed=True)
+            metrics.observe("time_to_first_token", (self.time_to_first_token or self.total_time) * 1000)
+            _query_flights.resolve(owned, {self.key: {
+                "question": self.question, "answer": self.text, "error": None,
+                "retrieval_seconds": self.retrieval_time, "synthesis_seconds": self.total_time - self.retrieval_time,
+            }})
+            owned = {}
+            logging.info(
+                "Answered question in %.2fs (first token after %.2fs)",
+                self.total_time, self.time_to_first_token or self.total_time
+            )
+
+        except Exception as e:
+            _query_flights.resolve(owned, error=e)
+            owned = {}
+            # Raise a custom exception with detailed info if anything goes wrong
+            raise customexception(e, sys)
+
+        finally:
+            # A stream abandoned midway (e.g. a Streamlit rerun) must not leave other sessions waiting
+            if owned:
+                _query_flights.resolve(owned, error=RuntimeError("The answer stream was interrupted"))
+
+    def timings(self):
+        """
+        Returns:
+        - dict: Retrieval time, time to first token and total generation time in seconds
+        """
+        return {
+            "retrieval_time": self.retrieval_time,
+            "time_to_first_token": self.time_to_first_token,
+            "total_time": self.total_time,
+        }
+
+
+async def answer_one_async(query_engine, question, semaphore=None, key=None):
+    """
+    Answers one question through the engine's async path, timing retrieval and synthesis.
+
+    Parameters:
+    - query_engine: A non-streaming RetrieverQueryEngine
+    - question (str): The question to answer
+    - semaphore (asyncio.Semaphore): Optional cap shared by concurrent LLM calls
+    - key: Coalesces concurrent identical questions (see query_key)
+
+    Returns:
+    - dict: 'question', 'answer', 'error', 'retrieval_seconds' and 'synthesis_seconds'
+    """
+    if key is not None:
+        # Identical questions in flight (from this batch or another session) share one call
+        shared = await _query_flights.do_async(key, lambda: answer_one_async(query_engine, question, semaphore))
+        return {**shared, "question": question}
+
+    query_bundle = QueryBundle(question)
+    result = {"question": question, "answer": None, "error": None, "retrieval_seconds": None, "synthesis_seconds": None}
+    try:
+        # Retrieval (query embedding + vector search) is not capped
+        start = time.perf_counter()
+        nodes = await query_engine.aretrieve(query_bundle)
+        result["retrieval_seconds"] = time.perf_counter() - start
+        metrics.observe("retrieve", result["retrieval_seconds"] * 1000, chunks=len(nodes))
+
+        # LLM synthesis is capped so a large batch does not exceed the rate limit
+        async with semaphore or nullcontext():
+            start = time.perf_counter()
+            response = await query_engine.asynthesize(query_bundle, nodes)
+            result["synthesis_seconds"] = time.perf_counter() - start
+            metrics.observe("synthesize", result["synthesis_seconds"] * 1000, streamed=False)
+        result["answer"] = str(response)
+    except Exception as e:
+        result["error"] = str(e)
+        logging.info("Question failed: %s", e)
+    return result
+
+
+async def answer_all_async(query_engine, questions, max_concurrency=MAX_CONCURRENT_QUESTIONS, on_answer=None, index_key=None):
+    """
+    Answers several questions concurrently through the engine's async path.
+
+    Retrieval for all questions is issued together; LLM synthesis then runs
+    with at most `max_concurrency` calls in flight, and `on_answer` is called
+    as each answer completes, so the batch takes roughly as long as its
+    slowest question rather than the sum of all of them.
+
+    Parameters:
+    - query_engine: A non-streaming RetrieverQueryEngine
+    - questions (list[str]): Questions to answer
+    - max_concurrency (int): Maximum number of concurrent LLM calls
+    - on_answer (callable): Called as on_answer(position, result) when a question finishes
+    - index_key (str): Identifies the index so identical questions in flight are answered once
+
+    Returns:
+    - list[dict]: Per question: 'question', 'answer', 'error' and 'seconds', in input order
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = [None] * len(questions)
+    start = time.perf_counter()
+
+    async def answer(position, question):
+        # Retrieval for every question starts at once; synthesis shares the cap
+        key = query_key(index_key, question) if index_key is not None else None
+        result = await answer_one_async(query_engine, question, semaphore, key)
+        result["seconds"] = time.perf_counter() - start
+        results[position] = result
+        if on_answer is not None:
+            on_answer(position, result)
+
+    await asyncio.gather(*(answer(position, question) for position, question in enumerate(questions)))
+
+    logging.info("Answered %d questions concurrently in %.2fs", len(questions), time.perf_counter() - start)
+    return results
+
+
+def answer_all(query_engine, questions, max_concurrency=MAX_CONCURRENT_QUESTIONS, on_answer=None, index_key=None):
+    """
+    Synchronous wrapper around answer_all_async for callers without an event loop.
+
+    Parameters:
+    - query_engine: A non-streaming RetrieverQueryEngine
+    - questions (list[str]): Questions to answer
+    - max_concurrency (int): Maximum number of concurrent LLM calls
+    - on_answer (callable): Called as on_answer(position, result) when a question finishes
+    - index_key (str): Identifies the index so identical questions in flight are answered once
+
+    Returns:
+    - list[dict]: Per question: 'question', 'answer', 'error' and 'seconds', in input order
+    """
+    try:
+        return asyncio.run(answer_all_async(query_engine, questions, max_concurrency, on_answer, index_key))
+    except Exception as e:
+        # Raise a custom exception with detailed info if anything goes wrong
+        raise customexception(e, sys)
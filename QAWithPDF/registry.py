@@ -0,0 +1,190 @@
+# Import hashlib to key indexes by the content of the uploaded file
+import hashlib
+
+# Import threading so the registry can be shared by concurrent Streamlit sessions
+import threading
+
+# Import OrderedDict to keep entries in least-recently-used order
+from collections import OrderedDict
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# Default memory budget for all cached indexes together (1 GiB)
+INDEX_MEMORY_BUDGET = 1 << 30
+
+# Bytes per embedding dimension in the vector store (float32)
+BYTES_PER_DIMENSION = 4
+
+# Dimensionality of Gemini embedding-001 vectors
+EMBEDDING_DIM = 768
+
+
+def content_key(content):
+    """
+    Builds the registry key for an uploaded file.
+
+    Parameters:
+    - content (bytes): Raw bytes of the uploaded file
+
+    Returns:
+    - str: Hex digest of the content
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def estimate_index_bytes(index, dim=EMBEDDING_DIM):
+    """
+    Roughly estimates the memory held by an index: node text plus one float32 vector per node.
+
+    Parameters:
+    - index (VectorStoreIndex): The index to measure
+    - dim (int): Embedding dimensionality
+
+    Returns:
+    - int: Estimated size in bytes
+    """
+    nodes = index.docstore.docs
+    text_bytes = sum(len(node.get_content()) for node in nodes.values())
+    return text_bytes + len(nodes) * dim * BYTES_PER_DIMENSION
+
+
+class IndexRegistry:
+    """
+    Process-wide LRU cache of indexes keyed by uploaded-content hash.
+
+    Every session that uploads the same file gets the same index, which is
+    built only once even when several sessions ask for it at the same time.
+    When the estimated size of all entries exceeds the memory budget, the
+    least recently used entries are dropped from the registry (sessions that
+    still hold a reference keep using theirs until they ask again).
+    """
+
+    def __init__(self, memory_budget=INDEX_MEMORY_BUDGET):
+        """
+        Parameters:
+        - memory_budget (int): Maximum estimated bytes of all cached entries
+        """
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key):
+        """
+        Returns the cached value for a key and marks it as recently used.
+
+        Returns:
+        - The cached value, or None if the key is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached value for a key, building it with `factory` on a miss.
+
+        Concurrent callers asking for the same key wait for a single build.
+
+        Parameters:
+        - key (str): Registry key (e.g. content hash of the upload)
+        - factory (callable): Returns (value, estimated size in bytes)
+
+        Returns:
+        - The cached or newly built value
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another session may have finished building while we waited
+            value = self.get(key)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                return value
+
+            try:
+                value, size = factory()
+            except BaseException:
+                # Let the next caller retry the build
+                with self._lock:
+                    self._key_locks.pop(key, None)
+                raise
+
+            # Publish the entry and retire the key lock together, so a caller arriving
+            # in between can neither miss the entry nor start a second build
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (value, size)
+                self._total += size
+                self._evict(keep=key)
+                self._key_locks.pop(key, None)
+
+            logging.info("Registered index %s (%.1f MB, %d cached)", key[:12], size / 2**20, len(self._entries))
+            return value
+
+    def _evict(self, keep):
+        """
+        Drops least recently used entries until the registry fits its budget (caller holds the lock).
+        """
+        while self._total > self.memory_budget and len(self._entries) > 1:
+            key, (_, size) = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._total -= size
+            self.evictions += 1
+            logging.info("Evicted index %s (%.1f MB)", key[:12], size / 2**20)
+
+    def stats(self):
+        """
+        Reports registry usage.
+
+        Returns:
+        - dict: Entry count, estimated bytes, budget and hit/miss/eviction counters
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "budget": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide registry shared by every Streamlit session
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_index_registry(memory_budget=INDEX_MEMORY_BUDGET):
+    """
+    Returns the process-wide index registry, creating it on first use.
+
+    Parameters:
+    - memory_budget (int): Budget used when the registry is created
+
+    Returns:
+    - IndexRegistry: The shared registry
+    """
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = IndexRegistry(memory_budget)
+        return _shared_registry
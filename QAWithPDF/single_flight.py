@@ -0,0 +1,123 @@
+# Import threading so calls can be coalesced across Streamlit sessions
+import threading
+
+# Import asyncio to let coroutines wait for a call running in another thread or event loop
+import asyncio
+
+# Import Future as a thread-safe, loop-independent handle on an in-flight call
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls into one.
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight wait for it and receive the same result (or exception) instead
+    of repeating the work. Results are not kept once the call completes:
+    caching is left to EmbeddingCache and AnswerCache.
+
+    Waiting works from threads and from coroutines in any event loop, so
+    sessions running their own `asyncio.run` share calls with each other.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys):
+        """
+        Registers the caller for several keys at once.
+
+        Parameters:
+        - keys (list): Keys of the calls the caller needs
+
+        Returns:
+        - tuple: (owned, pending) dicts of key to Future. The caller must run
+          the calls it owns and pass them to `resolve`; pending calls are
+          already in flight elsewhere and only need to be waited on.
+        """
+        owned, pending = {}, {}
+        with self._lock:
+            for key in keys:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    owned[key] = future
+                else:
+                    pending[key] = future
+                    self.shared += 1
+        return owned, pending
+
+    def resolve(self, owned, results=None, error=None):
+        """
+        Completes owned calls and wakes every caller waiting on them.
+
+        Parameters:
+        - owned (dict): Key to Future, as returned by `claim`
+        - results (dict): Key to result (ignored when `error` is given)
+        - error (BaseException): Exception to raise in every waiting caller
+        """
+        with self._lock:
+            for key in owned:
+                self._calls.pop(key, None)
+        for key, future in owned.items():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[key])
+
+    def do(self, key, fn):
+        """
+        Runs `fn()` unless an identical call is in flight, and returns its result.
+
+        Parameters:
+        - key: Identifies identical calls
+        - fn (callable): Performs the call
+
+        Returns:
+        - The result of the (possibly shared) call
+        """
+        owned, pending = self.claim([key])
+        if pending:
+            return pending[key].result()
+        try:
+            value = fn()
+        except BaseException as e:
+            self.resolve(owned, error=e)
+            raise
+        self.resolve(owned, {key: value})
+        return value
+
+    async def do_async(self, key, fn):
+        """
+        Awaits `fn()` unless an identical call is in flight, and returns its result.
+
+        Parameters:
+        - key: Identifies identical calls
+        - fn (callable): Returns the coroutine performing the call
+
+        Returns:
+        - The result of the (possibly shared) call
+        """
+        owned, pending = self.claim([key])
+        if pending:
+            return await asyncio.wrap_future(pending[key])
+        try:
+            value = await fn()
+        except BaseException as e:
+            self.resolve(owned, error=e)
+            raise
+        self.resolve(owned, {key: value})
+        return value
+
+    def stats(self):
+        """
+        Reports coalescing.
+
+        Returns:
+        - dict: Calls currently in flight and calls that were served by another caller
+        """
+        with self._lock:
+            return {"in_flight": len(self._calls), "shared": self.shared}
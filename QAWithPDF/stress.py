@@ -0,0 +1,109 @@
+# Import os and tempfile to give every concurrently built index its own persist directory
+import os
+import tempfile
+
+# Import argparse to run the stress check from the command line
+import argparse
+
+# Import ThreadPoolExecutor to build and query indexes in parallel threads
+from concurrent.futures import ThreadPoolExecutor
+
+# Import Document and the offline mock models shipped with llama_index
+from llama_index.core import Document
+from llama_index.core.llms import MockLLM
+from llama_index.core.embeddings import MockEmbedding
+
+# Import the per-index configuration and the index lifecycle helper
+from QAWithPDF.config import IndexConfig
+from QAWithPDF.index_storage import load_or_build_index
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# Chunk settings (chunk_size, chunk_overlap) built side by side
+CHUNK_SETTINGS = ((128, 10), (256, 20), (512, 0), (800, 20))
+
+
+def _build(documents, chunk_size, chunk_overlap, persist_dir):
+    """
+    Builds one index with its own configuration (runs in a worker thread).
+    """
+    config = IndexConfig(
+        llm=MockLLM(max_tokens=16),
+        embed_model=MockEmbedding(embed_dim=64),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    index = load_or_build_index(documents, config, persist_dir=persist_dir)
+    return config, index
+
+
+def run_stress(text, chunk_settings=CHUNK_SETTINGS, copies=2, queries_per_index=10, workers=8):
+    """
+    Builds and queries several indexes with different chunk settings concurrently.
+
+    Each concurrently built index must contain exactly the chunks its own
+    configuration produces, and every answer must cite nodes of the index
+    that was queried. Any cross-talk between indexes raises AssertionError.
+
+    Parameters:
+    - text (str): Corpus text to index
+    - chunk_settings (tuple): (chunk_size, chunk_overlap) pairs to build side by side
+    - copies (int): Number of concurrent builds per setting
+    - queries_per_index (int): Number of concurrent queries per built index
+    - workers (int): Number of threads
+
+    Returns:
+    - dict: Number of indexes built and queries answered
+    """
+    documents = [Document(text=text, id_="stress.txt")]
+
+    # Expected chunks for every setting, computed sequentially
+    expected = {
+        settings: sorted(
+            node.get_content()
+            for node in IndexConfig(chunk_size=settings[0], chunk_overlap=settings[1])
+            .node_parser().get_nodes_from_documents(documents)
+        )
+        for settings in chunk_settings
+    }
+
+    with tempfile.TemporaryDirectory() as root, ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [
+            (settings, pool.submit(_build, documents, settings[0], settings[1], os.path.join(root, f"{n}_{settings[0]}")))
+            for n in range(copies)
+            for settings in chunk_settings
+        ]
+        built = [(settings, future.result()) for settings, future in jobs]
+
+        for settings, (_, index) in built:
+            chunks = sorted(node.get_content() for node in index.docstore.docs.values())
+            assert chunks == expected[settings], f"Index built with {settings} holds chunks of another configuration"
+
+        def ask(config, index, n):
+            response = config.query_engine(index).query(f"Question {n} about the document")
+            node_ids = {source.node.node_id for source in response.source_nodes}
+            assert node_ids <= set(index.docstore.docs), "Answer cites nodes from another index"
+
+        queries = [
+            pool.submit(ask, config, index, n)
+            for _, (config, index) in built
+            for n in range(queries_per_index)
+        ]
+        for future in queries:
+            future.result()
+
+    logging.info("Stress check passed: %d indexes, %d queries", len(built), len(queries))
+    return {"indexes": len(built), "queries": len(queries)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query indexes with different chunk settings in parallel.")
+    parser.add_argument("--corpus", default=os.path.join("Data", "MLDOC.txt"), help="Text file to index")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        result = run_stress(f.read(), workers=args.workers)
+    print(f"OK: built {result['indexes']} indexes and answered {result['queries']} queries concurrently")
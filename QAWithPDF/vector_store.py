@@ -0,0 +1,634 @@
+# Import os to build file paths inside the persist directory
+import os
+
+# Import json to read and write the id mapping file and legacy JSON stores
+import json
+
+# Import argparse to expose the migration tool on the command line
+import argparse
+
+# Import threading so a store can be queried while a background build adds to it
+import threading
+
+# Import numpy for the contiguous float32 embedding matrix and vectorized search
+import numpy as np
+
+# Import the vector store interface and query types used by llama_index
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+# Import the shared top-k helper and the cleanup of a stale approximate index
+from QAWithPDF.ann import remove_ivf, top_k
+
+# Import float16/int8 encoding with full-precision rescoring
+from QAWithPDF.quantization import RESCORE_FACTOR, quantize, quantize_blocks, quantized_search
+from QAWithPDF.quantization import codes_path, save_codes, load_codes, remove_codes
+
+# Import logging for tracking process flow
+from logger import logging
+
+
+# File holding the float32 embedding matrix (one row per node)
+MATRIX_FILE = "vector_store.npy"
+
+# File mapping matrix rows to node ids and reference document ids
+IDS_FILE = "vector_store_ids.json"
+
+# File written by llama_index's default SimpleVectorStore
+LEGACY_JSON_FILE = "default__vector_store.json"
+
+
+def _normalize(matrix):
+    """
+    Scales rows to unit length so a dot product equals cosine similarity.
+
+    Parameters:
+    - matrix (np.ndarray): 2-D float array
+
+    Returns:
+    - np.ndarray: float32 array of unit-length rows (zero rows are left as zeros)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class RowBuffer:
+    """
+    A 2-D float32 matrix made of fixed base rows followed by a growable in-memory tail.
+
+    The base is usually the memory-mapped `.npy` file, so inserting after a
+    load never copies the persisted rows into RAM; only new rows live in the
+    tail, which doubles its capacity as it fills. Supports the operations
+    the store and its indexes use: len, row slices, row selection by index
+    arrays and a matrix-vector product.
+    """
+
+    def __init__(self, base=None, dim=None):
+        """
+        Parameters:
+        - base (np.ndarray): Existing rows (may be a memory map), or None
+        - dim (int): Row width; taken from `base` when given
+        """
+        self.dim = base.shape[1] if base is not None else dim
+        self.base = base if base is not None else np.zeros((0, dim), np.float32)
+        self._tail = np.empty((0, self.dim), np.float32)
+        self._tail_rows = 0
+
+    @property
+    def tail(self):
+        return self._tail[:self._tail_rows]
+
+    @property
+    def shape(self):
+        return (len(self), self.dim)
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return len(self.base) + self._tail_rows
+
+    def append(self, vectors):
+        """
+        Adds rows at the end, growing the tail buffer geometrically.
+
+        Parameters:
+        - vectors (np.ndarray): float32 rows of width `dim`
+        """
+        needed = self._tail_rows + len(vectors)
+        if needed > len(self._tail):
+            grown = np.empty((max(needed, 2 * len(self._tail), 1024), self.dim), np.float32)
+            grown[:self._tail_rows] = self.tail
+            self._tail = grown
+        self._tail[self._tail_rows:needed] = vectors
+        self._tail_rows = needed
+
+    def __getitem__(self, index):
+        split = len(self.base)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1 and stop <= split:
+                return self.base[start:stop]
+            if step == 1 and start >= split:
+                return self.tail[start - split:stop - split]
+            index = np.arange(start, stop, step)
+        rows = np.asarray(index, dtype=np.int64)
+        if rows.ndim == 0:
+            return self.base[rows] if rows < split else self.tail[rows - split]
+        out = np.empty((len(rows), self.dim), np.float32)
+        in_base = rows < split
+        out[in_base] = self.base[rows[in_base]]
+        out[~in_base] = self.tail[rows[~in_base] - split]
+        return out
+
+    def __matmul__(self, vector):
+        return np.concatenate([self.base @ vector, self.tail @ vector])
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps embeddings in one contiguous float32 matrix.
+
+    The matrix is persisted as a `.npy` file and memory-mapped on load, so
+    opening an index costs neither JSON parsing nor a Python float per
+    dimension. Rows inserted afterwards go to an in-memory tail (RowBuffer)
+    instead of copying the mapped rows. Queries run as a single matrix-vector product over all rows,
+    or through an IVFIndex once the store is large enough for one to pay off.
+    With `quantization` set, the scan (exact, or over the probed IVF
+    clusters) runs over float16 or int8 codes held in memory and only a
+    shortlist is rescored against the memory-mapped float32 matrix. An
+    optional BM25Index is kept in step with the rows so the same chunks can
+    also be searched by keyword.
+    Only node ids are kept here; node text stays in the docstore.
+    Reads and writes share one lock, so the store can be queried while a
+    background build is still adding to it.
+    """
+
+    stores_text: bool = False
+
+    _matrix = PrivateAttr()
+    _pending = PrivateAttr()
+    _ids = PrivateAttr()
+    _ref_doc_ids = PrivateAttr()
+    _alive = PrivateAttr()
+    _row_of = PrivateAttr()
+    _rows_of_doc = PrivateAttr()
+    _dirty = PrivateAttr()
+    _ann = PrivateAttr()
+    _lexical = PrivateAttr()
+    _quantization = PrivateAttr()
+    _rescore_factor = PrivateAttr()
+    _codes = PrivateAttr()
+    _scales = PrivateAttr()
+    _lock = PrivateAttr()
+    _training = PrivateAttr()
+    _generation = PrivateAttr()
+
+    def __init__(
+        self,
+        matrix=None,
+        ids=None,
+        ref_doc_ids=None,
+        ann=None,
+        quantization=None,
+        rescore_factor=RESCORE_FACTOR,
+        codes=None,
+        lexical=None,
+        **kwargs
+    ):
+        """
+        Creates a store, optionally from existing rows.
+
+        Parameters:
+        - matrix (np.ndarray): Unit-length float32 rows (may be a memory map)
+        - ids (list[str]): Node id of each row
+        - ref_doc_ids (list[str]): Reference document id of each row
+        - ann (IVFIndex): Optional approximate index used for large stores
+        - quantization (str): None, 'float16' or 'int8' for compact in-memory search
+        - rescore_factor (int): Shortlist size as a multiple of top-k for full-precision rescoring
+        - codes (tuple): Precomputed (codes, scales) matching `matrix`
+        - lexical (BM25Index): Optional keyword index over the same nodes
+        """
+        super().__init__(**kwargs)
+        self._ids = list(ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [None] * len(self._ids))
+        self._matrix = RowBuffer(matrix) if matrix is not None else None
+        self._pending = []
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._row_of = {node_id: row for row, node_id in enumerate(self._ids)}
+        self._rows_of_doc = {}
+        for row, ref_doc_id in enumerate(self._ref_doc_ids):
+            self._rows_of_doc.setdefault(ref_doc_id, []).append(row)
+        self._dirty = False
+        self._ann = ann
+        self._lexical = lexical
+        self._quantization = quantization
+        self._rescore_factor = rescore_factor
+        self._codes, self._scales = None, None
+        self._lock = threading.RLock()
+        self._training = threading.Lock()
+        # Bumped whenever rows are renumbered, so a training run started before can be discarded
+        self._generation = 0
+        if quantization and matrix is not None:
+            # Recompute codes that are missing or out of date with the matrix
+            if codes is None or len(codes[0]) != len(matrix):
+                codes = quantize_blocks(matrix, quantization)
+            self._codes, self._scales = codes
+
+    @classmethod
+    def class_name(cls):
+        return "NumpyVectorStore"
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, ann=None, quantization=None, lexical=None):
+        """
+        Loads a store from a persist directory, memory-mapping the embedding matrix.
+
+        Parameters:
+        - persist_dir (str): Directory containing the matrix and id mapping files
+        - ann (IVFIndex): Optional approximate index, restored from disk if it was persisted
+        - quantization (str): None, 'float16' or 'int8'; codes are read from disk when available
+        - lexical (BM25Index): Optional keyword index, restored from disk if it was persisted
+
+        Returns:
+        - NumpyVectorStore: The loaded store
+        """
+        with open(os.path.join(persist_dir, IDS_FILE)) as f:
+            mapping = json.load(f)
+        matrix = np.load(os.path.join(persist_dir, MATRIX_FILE), mmap_mode="r")
+        rows = len(matrix)
+        if not rows:
+            # An empty store has no known dimension yet; the first insert sets it
+            matrix = None
+        if ann is not None:
+            ann.load(persist_dir, rows=rows)
+        if lexical is not None:
+            lexical.load(persist_dir)
+        codes = load_codes(persist_dir, quantization, rows=rows) if quantization else None
+        return cls(
+            matrix=matrix,
+            ids=mapping["ids"],
+            ref_doc_ids=mapping["ref_doc_ids"],
+            ann=ann,
+            quantization=quantization,
+            codes=codes,
+            lexical=lexical,
+        )
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def lexical(self):
+        """The BM25Index over the stored nodes, or None."""
+        return self._lexical
+
+    @property
+    def lock(self):
+        """Re-entrant lock guarding the store; hold it around multi-step inserts into the owning index."""
+        return self._lock
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    def __bool__(self):
+        # StorageContext.from_defaults tests `if vector_store:`; an empty store must not be swapped out
+        return True
+
+    def _consolidate(self):
+        """
+        Moves rows added since the last query into the matrix.
+        """
+        if self._pending:
+            if self._quantization:
+                codes, scales = quantize(np.concatenate(self._pending), self._quantization)
+                if self._codes is not None:
+                    codes = np.concatenate([self._codes, codes])
+                    scales = np.concatenate([self._scales, scales]) if scales is not None else None
+                self._codes, self._scales = codes, scales
+            # New rows go to the buffer's tail; the memory-mapped base is never copied
+            if self._matrix is None:
+                self._matrix = RowBuffer(dim=self._pending[0].shape[1])
+            for vectors in self._pending:
+                self._matrix.append(vectors)
+            self._pending = []
+
+    def _append(self, node_ids, ref_doc_ids, vectors):
+        """
+        Appends rows for new nodes, replacing any existing rows with the same ids.
+        """
+        for node_id in node_ids:
+            row = self._row_of.get(node_id)
+            if row is not None:
+                self._alive[row] = False
+
+        start = len(self._ids)
+        self._ids.extend(node_ids)
+        self._ref_doc_ids.extend(ref_doc_ids)
+        self._alive = np.concatenate([self._alive, np.ones(len(node_ids), dtype=bool)])
+        for offset, (node_id, ref_doc_id) in enumerate(zip(node_ids, ref_doc_ids)):
+            self._row_of[node_id] = start + offset
+            self._rows_of_doc.setdefault(ref_doc_id, []).append(start + offset)
+        vectors = _normalize(vectors)
+        self._pending.append(vectors)
+        if self._ann is not None:
+            self._ann.add(vectors)
+        self._dirty = True
+
+    def add(self, nodes, **add_kwargs):
+        """
+        Adds embedded nodes to the store.
+
+        Parameters:
+        - nodes (list[BaseNode]): Nodes that already carry an embedding
+
+        Returns:
+        - list[str]: Ids of the added nodes
+        """
+        with self._lock:
+            if not nodes:
+                return []
+            node_ids = [node.node_id for node in nodes]
+            self._append(node_ids, [node.ref_doc_id for node in nodes], [node.get_embedding() for node in nodes])
+            if self._lexical is not None:
+                self._lexical.add_nodes(nodes)
+            return node_ids
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        """
+        Removes every row belonging to a reference document.
+
+        Parameters:
+        - ref_doc_id (str): Id of the source document whose nodes are removed
+        """
+        with self._lock:
+            removed = []
+            for row in self._rows_of_doc.pop(ref_doc_id, []):
+                if self._alive[row]:
+                    self._alive[row] = False
+                    if self._row_of.get(self._ids[row]) == row:
+                        del self._row_of[self._ids[row]]
+                        removed.append(self._ids[row])
+                    self._dirty = True
+            if self._lexical is not None:
+                self._lexical.remove(removed)
+
+    def get_vectors(self, node_ids):
+        """
+        Returns the stored (unit-length) vectors for the given node ids.
+
+        Parameters:
+        - node_ids (list[str]): Ids of nodes present in the store
+
+        Returns:
+        - np.ndarray: One row per id
+        """
+        with self._lock:
+            self._consolidate()
+            return np.asarray(self._matrix[[self._row_of[node_id] for node_id in node_ids]])
+
+    def _candidate_mask(self, query):
+        """
+        Combines the deletion mask with the query's node id / document id restrictions.
+        """
+        mask = self._alive.copy()
+        if query.node_ids:
+            allowed = np.zeros_like(mask)
+            allowed[[self._row_of[i] for i in query.node_ids if i in self._row_of]] = True
+            mask &= allowed
+        if query.doc_ids:
+            allowed = np.zeros_like(mask)
+            for doc_id in set(query.doc_ids):
+                allowed[self._rows_of_doc.get(doc_id, [])] = True
+            mask &= allowed
+        return mask
+
+    def train_ann(self):
+        """
+        Trains the approximate index, or retrains it once the store has outgrown it.
+
+        k-means runs on a snapshot outside the store lock, so queries keep
+        using the previous clustering (or the exact scan) meanwhile. Rows
+        added during training are assigned to the new centroids before they
+        are installed; a run that overlaps a compacting persist is discarded.
+        Called at build, sync and persist time, never from `query`.
+
+        Returns:
+        - bool: True if a new clustering was installed
+        """
+        if self._ann is None or not self._training.acquire(blocking=False):
+            # Another thread is already training this store
+            return False
+        try:
+            with self._lock:
+                self._consolidate()
+                live_rows = int(self._alive.sum())
+                if self._matrix is None or not self._ann.needs_training(live_rows):
+                    return False
+                matrix, alive, generation = self._matrix, self._alive.copy(), self._generation
+
+            centroids, assignment = self._ann.fit(matrix, alive)
+
+            with self._lock:
+                if generation != self._generation:
+                    logging.info("Discarding IVF training run: rows were renumbered meanwhile")
+                    return False
+                self._consolidate()
+                if len(self._matrix) > len(alive):
+                    assignment = np.concatenate([assignment, self._ann.assign(self._matrix[len(alive):], centroids)])
+                self._ann.install(centroids, assignment, live_rows)
+                return True
+        finally:
+            self._training.release()
+
+    def query(self, query: VectorStoreQuery, **kwargs):
+        """
+        Finds the nodes most similar to the query embedding by cosine similarity.
+
+        Parameters:
+        - query (VectorStoreQuery): Query embedding, top-k and optional id restrictions
+
+        Returns:
+        - VectorStoreQueryResult: Ids and similarities of the best matches, best first
+        """
+        with self._lock:
+            if query.filters is not None:
+                raise ValueError("Metadata filters are not supported by NumpyVectorStore")
+
+            self._consolidate()
+            if self._matrix is None or not len(self._ids):
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+            query_vector = _normalize([query.query_embedding])[0]
+
+            mask = self._candidate_mask(query)
+
+            # Training happens in train_ann; an untrained index falls back to the exact scan
+            if self._ann is not None and self._ann.trained:
+                if self._quantization:
+                    # Score the rows of the closest clusters with compact codes, then rescore a shortlist
+                    rows, similarities = quantized_search(
+                        self._codes, self._scales, self._matrix, query_vector, mask,
+                        query.similarity_top_k, rescore_factor=self._rescore_factor,
+                        rows=self._ann.probe(query_vector, mask)
+                    )
+                else:
+                    # Score only the rows in the clusters closest to the query
+                    rows, similarities = self._ann.search(query_vector, self._matrix, mask, query.similarity_top_k)
+            elif self._quantization:
+                # Scan compact codes, then rescore a shortlist at full precision
+                rows, similarities = quantized_search(
+                    self._codes, self._scales, self._matrix, query_vector, mask,
+                    query.similarity_top_k, rescore_factor=self._rescore_factor
+                )
+            else:
+                # One vectorized matrix-vector product scores every stored chunk
+                scores = np.where(mask, self._matrix @ query_vector, -np.inf)
+                rows = [row for row in top_k(scores, query.similarity_top_k) if np.isfinite(scores[row])]
+                similarities = scores[rows]
+
+            return VectorStoreQueryResult(
+                nodes=None,
+                similarities=[float(score) for score in similarities],
+                ids=[self._ids[row] for row in rows],
+            )
+
+    def persist(self, persist_path, fs=None):
+        """
+        Writes the matrix and id mapping next to `persist_path`.
+
+        llama_index passes the path of its default JSON file; only its
+        directory is used. Deleted rows are compacted away on write.
+
+        Parameters:
+        - persist_path (str): Path inside the persist directory
+        """
+        with self._lock:
+            persist_dir = os.path.dirname(persist_path)
+            matrix_path = os.path.join(persist_dir, MATRIX_FILE)
+            if not self._dirty and os.path.exists(matrix_path):
+                # The IVF index may have been (re)trained since the last write
+                if self._ann is not None and self._ann.dirty:
+                    self._ann.save(persist_dir)
+                if self._lexical is not None and self._lexical.dirty:
+                    self._lexical.save(persist_dir)
+                if (self._quantization and self._codes is not None
+                        and not os.path.exists(codes_path(persist_dir, self._quantization))):
+                    save_codes(persist_dir, self._quantization, self._codes, self._scales)
+                return
+
+            self._consolidate()
+            os.makedirs(persist_dir, exist_ok=True)
+
+            # Copy live rows into memory so the old memory map can be released before overwriting
+            rows = np.flatnonzero(self._alive)
+            dim = self._matrix.shape[1] if self._matrix is not None else 0
+            matrix = np.array(self._matrix[rows]) if self._matrix is not None else np.zeros((0, dim), np.float32)
+            self._matrix = RowBuffer(matrix)
+            self._generation += 1
+            self._ids = [self._ids[row] for row in rows]
+            self._ref_doc_ids = [self._ref_doc_ids[row] for row in rows]
+            self._alive = np.ones(len(self._ids), dtype=bool)
+            self._row_of = {node_id: row for row, node_id in enumerate(self._ids)}
+            self._rows_of_doc = {}
+            for row, ref_doc_id in enumerate(self._ref_doc_ids):
+                self._rows_of_doc.setdefault(ref_doc_id, []).append(row)
+            if self._ann is not None:
+                self._ann.compact(rows)
+            if self._quantization and self._codes is not None:
+                self._codes = self._codes[rows]
+                self._scales = self._scales[rows] if self._scales is not None else None
+
+            # Write to temporary files first so a crash never leaves a half-written store
+            tmp_matrix = matrix_path + ".tmp.npy"
+            np.save(tmp_matrix, matrix)
+            os.replace(tmp_matrix, matrix_path)
+
+            ids_path = os.path.join(persist_dir, IDS_FILE)
+            with open(ids_path + ".tmp", "w") as f:
+                json.dump({"ids": self._ids, "ref_doc_ids": self._ref_doc_ids}, f)
+            os.replace(ids_path + ".tmp", ids_path)
+
+            # Remove IVF and code files that no longer describe these rows
+            if self._ann is not None:
+                self._ann.save(persist_dir)
+            else:
+                remove_ivf(persist_dir)
+            if self._lexical is not None:
+                self._lexical.save(persist_dir)
+            if self._quantization and self._codes is not None:
+                save_codes(persist_dir, self._quantization, self._codes, self._scales)
+            else:
+                remove_codes(persist_dir)
+
+            # Serve further queries from the memory map instead of the in-memory copy
+            self._matrix = RowBuffer(np.load(matrix_path, mmap_mode="r")) if len(matrix) else None
+            self._dirty = False
+
+
+def has_numpy_store(persist_dir):
+    """
+    Checks whether a persist directory holds a NumpyVectorStore.
+
+    Parameters:
+    - persist_dir (str): Directory to check
+
+    Returns:
+    - bool: True if both the matrix and id mapping files exist
+    """
+    return os.path.exists(os.path.join(persist_dir, MATRIX_FILE)) and os.path.exists(
+        os.path.join(persist_dir, IDS_FILE)
+    )
+
+
+def load_vector_store(persist_dir, ann=None, quantization=None, lexical=None):
+    """
+    Opens the vector store of a persist directory, migrating a legacy JSON store on first use.
+
+    Parameters:
+    - persist_dir (str): Directory the index was persisted to
+    - ann (IVFIndex): Optional approximate index for large stores
+    - quantization (str): None, 'float16' or 'int8'
+    - lexical (BM25Index): Optional keyword index over the same nodes
+
+    Returns:
+    - NumpyVectorStore: The memory-mapped store
+    """
+    if not has_numpy_store(persist_dir) and os.path.exists(os.path.join(persist_dir, LEGACY_JSON_FILE)):
+        migrate_json_store(persist_dir)
+    return NumpyVectorStore.from_persist_dir(persist_dir, ann=ann, quantization=quantization, lexical=lexical)
+
+
+def migrate_json_store(persist_dir, remove_json=False):
+    """
+    Converts a SimpleVectorStore JSON file into the binary NumpyVectorStore format.
+
+    Parameters:
+    - persist_dir (str): Directory containing default__vector_store.json
+    - remove_json (bool): Delete the JSON file after a successful conversion
+
+    Returns:
+    - int: Number of vectors migrated
+    """
+    json_path = os.path.join(persist_dir, LEGACY_JSON_FILE)
+    logging.info("Migrating %s to %s...", json_path, MATRIX_FILE)
+
+    with open(json_path) as f:
+        data = json.load(f)
+
+    embedding_dict = data.get("embedding_dict", {})
+    ref_doc_map = data.get("text_id_to_ref_doc_id", {})
+    ids = list(embedding_dict.keys())
+
+    store = NumpyVectorStore()
+    if ids:
+        store._append(ids, [ref_doc_map.get(i) for i in ids], [embedding_dict[i] for i in ids])
+    store._dirty = True
+    store.persist(json_path)
+
+    if remove_json:
+        os.remove(json_path)
+
+    logging.info("Migrated %d vectors", len(ids))
+    return len(ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert JSON vector stores in storage directories to the binary .npy format."
+    )
+    parser.add_argument("persist_dirs", nargs="+", help="Storage directories to migrate")
+    parser.add_argument("--remove-json", action="store_true", help="Delete the JSON file afterwards")
+    args = parser.parse_args()
+
+    for directory in args.persist_dirs:
+        count = migrate_json_store(directory, remove_json=args.remove_json)
+        print(f"{directory}: migrated {count} vectors")
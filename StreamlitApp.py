@@ -2,18 +2,162 @@
 import streamlit as st  
 
 # Import helper functions from QAWithPDF module
-from QAWithPDF.data_ingestion import load_data  # Function to load uploaded PDF or text documents
-from QAWithPDF.embedding import download_gemini_embedding  # Function to create embeddings & query engine
-from QAWithPDF.model_api import load_model  # Function to load the Google Gemini LLM model
+from QAWithPDF.data_ingestion import iter_documents, upload_page_count  # Functions to stream and count uploaded pages
+from QAWithPDF.embedding import build_gemini_index, gemini_index_config  # Functions to configure & build the vector index
+from QAWithPDF.model_api import get_shared_model  # Function returning the shared Google Gemini LLM client
+from QAWithPDF.registry import content_key  # Identifies uploads by content
+from QAWithPDF.background import get_index_builder  # Builds indexes in the background at upload time
+from QAWithPDF.index_storage import PERSIST_DIR  # Root directory for persisted indexes
+from QAWithPDF.query import StreamedAnswer, answer_all, query_key  # Streamed single answers and concurrent batch answers
+from QAWithPDF.answer_cache import get_answer_cache, index_fingerprint  # Shared cache of answers per index
+from logger import metrics  # Per-stage latency histograms and counters
 
 # Import dotenv to manage environment variables securely
 from dotenv import load_dotenv
 import os  # Provides access to environment variables and OS operations
+import time  # Measures how quickly cached answers are served
 
 # Load environment variables from .env file
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # Retrieve the Google API key from environment
 
+# Start (or join) the background build of the shared index for an uploaded document
+def start_index_build(doc, retry=False):
+    """
+    Starts indexing an upload in the background, or returns the build already running for it.
+
+    Parameters:
+    - doc: The Streamlit UploadedFile
+    - retry (bool): Start over if the previous build of this upload failed
+
+    Returns:
+    - IndexBuild: The running or finished build
+    """
+    # Identify the upload by content so every session uploading it shares one index
+    doc_key = content_key(doc.getvalue())
+
+    def build(job):
+        job.pages_total = upload_page_count(doc)
+
+        # Stream pages of the uploaded file so embedding starts before parsing finishes
+        return build_gemini_index(
+            job.config.llm, job.count_pages(iter_documents(doc)), google_api_key=GOOGLE_API_KEY,
+            use_async=True, persist_dir=os.path.join(PERSIST_DIR, doc_key[:16]), config=job.config,
+            on_progress=job.on_progress
+        )
+
+    # Models and chunking are bound to this index, so builds can run in parallel
+    return get_index_builder().start(
+        doc_key, lambda: gemini_index_config(get_shared_model(), GOOGLE_API_KEY), build, retry=retry
+    )
+
+# Show how far the background build of the uploaded document has come
+def show_build_progress(job):
+    """
+    Displays pages parsed and chunks embedded until the index is complete.
+
+    Parameters:
+    - job (IndexBuild): The build to report on
+    """
+    progress = job.progress()
+    if progress["error"] is not None:
+        st.error(f"❌ Indexing failed: {progress['error']}")
+    elif progress["done"]:
+        st.caption(f"✅ Document indexed: {progress['chunks_embedded']} chunks from {progress['pages_parsed']} pages")
+    else:
+        total = progress["pages_total"]
+        label = (
+            f"⏳ Indexing in the background: {progress['pages_parsed']}"
+            f"{f' of {total}' if total else ''} pages parsed, {progress['chunks_embedded']} chunks embedded"
+        )
+        st.progress(min(progress["pages_parsed"] / total, 1.0) if total else 0.0, text=label)
+
+# Fetch the shared index for an uploaded document (complete or partial) and create this session's engines
+def load_query_engines(doc):
+    """
+    Makes sure the session has query engines for the uploaded document.
+
+    Questions asked while the document is still being indexed wait for the
+    first chunks and are then answered from the partial index, which keeps
+    growing underneath the same engines.
+
+    Parameters:
+    - doc: The Streamlit UploadedFile
+
+    Returns:
+    - IndexBuild: The build the engines query
+    """
+    job = start_index_build(doc)
+    if st.session_state.index_key == job.key:
+        return job
+
+    # Queue the question until the first chunks of the document are embedded
+    index = job.wait_for_index()
+    config = job.config
+    doc_key = job.key
+
+    # Keep the index and its configuration for answer-cache lookups
+    st.session_state.index = index
+    st.session_state.index_config = config
+
+    # Engines are cheap views over the shared index
+    st.session_state.query_engine = config.query_engine(index, streaming=True)  # Streams single answers
+    st.session_state.batch_engine = config.query_engine(index)  # Answers batches through the async path
+    st.session_state.index_key = doc_key
+    return job
+
+# Tell the user when an answer only covers the pages indexed so far
+def note_partial_answer(job):
+    """
+    Shows a note if `job` is still running.
+
+    Parameters:
+    - job (IndexBuild): The build the answer was generated from
+    """
+    if not job.done:
+        st.info(f"ℹ️ Answered from the {job.pages_parsed} pages indexed so far; the rest is still being indexed.")
+
+# Pick the question embedding used by the answer cache's similarity tier
+def question_embedder():
+    """
+    Returns the function that embeds questions for the similarity tier of the answer cache.
+
+    Returns:
+    - callable: The index's query embedding, or None for lexical-only indexes,
+      which make no embedding call at query time and so skip that tier
+    """
+    config = st.session_state.index_config
+    if config.retrieval_mode == "lexical":
+        return None
+    return config.embed_model.get_query_embedding
+
+# Look up a cached answer for a question about the current document
+def cached_answer(question):
+    """
+    Returns the cached answer to an identical or near-identical question, or None.
+
+    Parameters:
+    - question (str): The question to answer
+    """
+    return get_answer_cache().lookup(
+        st.session_state.index_key, index_fingerprint(st.session_state.index), question,
+        embed=question_embedder()
+    )
+
+# Remember a generated answer for later identical or similar questions
+def remember_answer(question, answer):
+    """
+    Stores an answer in the shared answer cache.
+
+    Parameters:
+    - question (str): The question that was answered
+    - answer (str): The generated answer
+    """
+    get_answer_cache().store(
+        st.session_state.index_key, index_fingerprint(st.session_state.index), question, answer,
+        embed=question_embedder()
+    )
+
 # Define the main function to run the Streamlit app
 def main():
     """
@@ -90,12 +234,30 @@ def main():
     st.sidebar.info(
         """
         1. Upload your PDF or text document.
-        2. Ask questions dynamically.
+        2. Ask questions while it is indexed in the background.
         3. Each question will generate a response below in chat style.
+        4. Use "Submit All" to answer every pending question at once.
         """
     )  # Instructions for users
     st.sidebar.write("⚠️ Ensure your Google API key is valid in `.env`.")  # Display API warning
 
+    # Latency percentiles per pipeline stage, recorded across all sessions of this process
+    with st.sidebar.expander("📊 Pipeline metrics"):
+        snapshot = metrics.snapshot()
+        if snapshot["spans"]:
+            st.dataframe(
+                {
+                    name: {key: round(value, 1) for key, value in stats.items()}
+                    for name, stats in snapshot["spans"].items()
+                },
+                use_container_width=True
+            )
+            st.json(snapshot["counters"], expanded=False)
+            if st.button("💾 Dump metrics"):
+                st.caption(f"Written to `{metrics.dump()}`")
+        else:
+            st.caption("No stages recorded yet." if metrics.enabled else "Metrics are disabled (QA_METRICS=0).")
+
     # ---------------- Main Page ----------------
     st.title("📄 QA with Documents")  # Main page title
     st.markdown(
@@ -110,22 +272,47 @@ def main():
 
     # ---------------- Session State Initialization ----------------
     # Initialize session variables to persist data between interactions
-    if "document" not in st.session_state:
-        st.session_state.document = None  # Store uploaded document
     if "query_engine" not in st.session_state:
-        st.session_state.query_engine = None  # Store query engine for LLM
+        st.session_state.query_engine = None  # Store streaming query engine for LLM
+    if "batch_engine" not in st.session_state:
+        st.session_state.batch_engine = None  # Store non-streaming engine for batch answers
+    if "index_key" not in st.session_state:
+        st.session_state.index_key = None  # Content hash of the document the engine was built for
+    if "index" not in st.session_state:
+        st.session_state.index = None  # Shared index the engines query (fingerprinted by the answer cache)
+    if "index_config" not in st.session_state:
+        st.session_state.index_config = None  # Models and chunking of that index
     if "questions" not in st.session_state:
         st.session_state.questions = []  # Store all questions dynamically
     if "responses" not in st.session_state:
         st.session_state.responses = []  # Store corresponding responses
+    if "timings" not in st.session_state:
+        st.session_state.timings = []  # Store time-to-first-token and total time per question
 
     # ---------------- File Upload ----------------
     doc = st.file_uploader("📂 Upload your document", type=["pdf", "txt"])  # Upload PDF or text file
 
+    # Start indexing as soon as the file arrives so it overlaps with typing the questions
+    if doc is not None:
+        build_job = start_index_build(doc)
+
+        # Refresh the progress display every second while the build runs
+        st.fragment(run_every=None if build_job.done else 1)(show_build_progress)(build_job)
+
+        # A failed build is kept (with its error) until the user asks for another attempt
+        if build_job.error is not None and st.button("🔁 Retry indexing"):
+            start_index_build(doc, retry=True)
+            st.rerun()
+
     # ---------------- Add New Question ----------------
     if st.button("➕ Add New Question"):  # Button to add a new question input
         st.session_state.questions.append("")  # Add empty string to questions list
 
+    # Make sure responses and timings have one slot per question
+    while len(st.session_state.responses) < len(st.session_state.questions):
+        st.session_state.responses.append(None)
+        st.session_state.timings.append(None)
+
     # ---------------- Dynamic Q&A ----------------
     for i in range(len(st.session_state.questions)):
         # Create text input for each question
@@ -142,34 +329,109 @@ def main():
             elif st.session_state.questions[i].strip() == "":  # Check if question is empty
                 st.warning("⚠️ Please enter a question!")
             else:
-                with st.spinner("Processing..."):  # Show spinner while processing
-                    try:
-                        # Load document only once
-                        if st.session_state.document is None:
-                            st.session_state.document = load_data(doc)
-
-                        # Load model and create query engine only once
-                        if st.session_state.query_engine is None:
-                            model = load_model()
-                            st.session_state.query_engine = download_gemini_embedding(
-                                model, st.session_state.document, google_api_key=GOOGLE_API_KEY
-                            )
-
-                        # Query the engine with the current question
-                        response = st.session_state.query_engine.query(st.session_state.questions[i])
-
-                        # Store response in session state
-                        if len(st.session_state.responses) <= i:
-                            st.session_state.responses.append(response.response)
-                        else:
-                            st.session_state.responses[i] = response.response
-
-                        # Display Q&A in styled boxes
-                        st.markdown(f"<div class='question-box'>❓ {st.session_state.questions[i]}</div>", unsafe_allow_html=True)
-                        st.markdown(f"<div class='answer-box'>💡 {st.session_state.responses[i]}</div>", unsafe_allow_html=True)
-
-                    except Exception as e:  # Handle exceptions
-                        st.error(f"❌ An error occurred: {str(e)}")
+                try:
+                    with st.spinner("Processing..."):  # Show spinner while the index is prepared
+                        job = load_query_engines(doc)
+
+                    # Display the question
+                    question = st.session_state.questions[i]
+                    st.markdown(f"<div class='question-box'>❓ {question}</div>", unsafe_allow_html=True)
+                    answer_box = st.empty()
+
+                    # Repeated and near-duplicate questions are answered from the cache
+                    start = time.perf_counter()
+                    cached = cached_answer(question)
+                    if cached is not None:
+                        elapsed = time.perf_counter() - start
+                        answer_box.markdown(f"<div class='answer-box'>💡 {cached}</div>", unsafe_allow_html=True)
+                        st.session_state.responses[i] = cached
+                        st.session_state.timings[i] = {"time_to_first_token": elapsed, "total_time": elapsed}
+                        metrics.observe("question", elapsed * 1000, cached=True)
+                        st.caption(f"⚡ Answered from cache in {elapsed * 1000:.0f}ms")
+                    else:
+                        # Fill the answer box as tokens arrive
+                        # Sessions asking the same question at the same moment share one LLM call
+                        answer = StreamedAnswer(
+                            st.session_state.query_engine, question,
+                            key=query_key(st.session_state.index_key, question)
+                        )
+                        for _ in answer:
+                            answer_box.markdown(f"<div class='answer-box'>💡 {answer.text}</div>", unsafe_allow_html=True)
+
+                        # Store response and timings in session state
+                        st.session_state.responses[i] = answer.text
+                        st.session_state.timings[i] = answer.timings()
+                        metrics.observe("question", answer.total_time * 1000, cached=False)
+                        remember_answer(question, answer.text)
+
+                        # Show perceived and total latency for this question
+                        st.caption(
+                            f"⏱️ First token after {answer.time_to_first_token or answer.total_time:.2f}s · "
+                            f"complete after {answer.total_time:.2f}s"
+                        )
+                        note_partial_answer(job)
+
+                except Exception as e:  # Handle exceptions
+                    st.error(f"❌ An error occurred: {str(e)}")
+
+    # ---------------- Submit All Pending Questions ----------------
+    if st.session_state.questions and st.button("🚀 Submit All", key="submit_all"):
+        # Pending questions are non-empty and not answered yet
+        pending = [
+            i for i, question in enumerate(st.session_state.questions)
+            if question.strip() and st.session_state.responses[i] is None
+        ]
+        if doc is None:  # Check if document is uploaded
+            st.warning("⚠️ Please upload a document first!")
+        elif not pending:
+            st.warning("⚠️ There are no unanswered questions to submit!")
+        else:
+            try:
+                with st.spinner("Processing..."):  # Show spinner while the index is prepared
+                    job = load_query_engines(doc)
+
+                # One placeholder per question, filled in as answers complete
+                boxes = {}
+                for i in pending:
+                    st.markdown(f"<div class='question-box'>❓ {st.session_state.questions[i]}</div>", unsafe_allow_html=True)
+                    boxes[i] = st.empty()
+                    boxes[i].markdown("<div class='answer-box'>⏳ Waiting for answer...</div>", unsafe_allow_html=True)
+
+                # Answer cached questions right away and send only the rest to the LLM
+                uncached = []
+                for i in pending:
+                    start = time.perf_counter()
+                    cached = cached_answer(st.session_state.questions[i])
+                    if cached is None:
+                        uncached.append(i)
+                        continue
+                    st.session_state.responses[i] = cached
+                    st.session_state.timings[i] = {"time_to_first_token": None, "total_time": time.perf_counter() - start}
+                    boxes[i].markdown(f"<div class='answer-box'>💡 {cached}</div>", unsafe_allow_html=True)
+
+                def show_answer(position, result):
+                    i = uncached[position]
+                    if result["error"] is not None:
+                        boxes[i].error(f"❌ An error occurred: {result['error']}")
+                        return
+                    st.session_state.responses[i] = result["answer"]
+                    st.session_state.timings[i] = {"time_to_first_token": None, "total_time": result["seconds"]}
+                    metrics.observe("question", result["seconds"] * 1000, cached=False)
+                    boxes[i].markdown(f"<div class='answer-box'>💡 {result['answer']}</div>", unsafe_allow_html=True)
+                    remember_answer(result["question"], result["answer"])
+
+                # Retrieve for all questions at once and synthesize answers concurrently
+                if uncached:
+                    answer_all(
+                        st.session_state.batch_engine,
+                        [st.session_state.questions[i] for i in uncached],
+                        on_answer=show_answer,
+                        index_key=st.session_state.index_key
+                    )
+                    note_partial_answer(job)
+
+            except Exception as e:  # Handle exceptions
+                st.error(f"❌ An error occurred: {str(e)}")
 
     # ---------------- Footer ----------------
     st.markdown("---")  # Horizontal line
@@ -7,6 +7,14 @@ import os
 # Import datetime to generate timestamps for log file names.
 from datetime import datetime  
 
+# Import json, threading and time for the structured metrics below
+import json
+import threading
+import time
+
+# Import deque to keep a bounded window of recent samples per histogram
+from collections import deque
+
 # Create a log file name using the current date and time, formatted as:
 # MM_DD_YYYY_HH_MM_SS.log
 LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"  
@@ -31,3 +39,196 @@ logging.basicConfig(
 )
 # Example log output:
 # [2024-01-10 15:57:26,997] 6 root - INFO - this is my second testing
+
+# Metrics are on unless QA_METRICS is set to 0, false or off
+METRICS_ENABLED = os.getenv("QA_METRICS", "1").lower() not in ("0", "false", "off")
+
+# JSON-lines file receiving one record per span and counter update, next to the log file
+METRICS_FILEPATH = os.path.join(log_path, LOG_FILE.replace(".log", ".metrics.jsonl"))
+
+# Number of most recent samples each histogram keeps for its percentiles
+HISTOGRAM_SAMPLES = 10000
+
+
+class _NullSpan:
+    """
+    Span returned while metrics are disabled; every operation is a no-op.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """
+    Times one pipeline stage and records it when the `with` block exits.
+    """
+
+    def __init__(self, metrics, name, attributes):
+        self._metrics = metrics
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """
+        Attaches attributes (e.g. number of chunks) to the span record.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        ms = (time.perf_counter() - self._start) * 1000
+        if exc is not None:
+            self.attributes["error"] = str(exc)
+        self._metrics.observe(self.name, ms, **self.attributes)
+        return False
+
+
+class Metrics:
+    """
+    Spans, counters and latency histograms for the QA pipeline.
+
+    Every span and counter update is appended to a JSON-lines file and
+    aggregated in memory, so percentiles can be read at any time with
+    `snapshot()` or written out with `dump()`. When disabled, `span()`
+    returns a shared no-op object and nothing is timed or written.
+
+    Stages recorded by the pipeline: parse, chunk, embed, persist,
+    load_index, retrieve and synthesize, plus load_data, load_model and
+    build_index around them.
+    """
+
+    def __init__(self, path=METRICS_FILEPATH, enabled=METRICS_ENABLED):
+        """
+        Parameters:
+        - path (str): JSON-lines file records are appended to
+        - enabled (bool): Record anything at all
+        """
+        self.path = path
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, record):
+        # The file is only created once something is recorded
+        if self._file is None:
+            self._file = open(self.path, "a", buffering=1)
+        self._file.write(json.dumps(record, default=str) + "\n")
+
+    def span(self, name, **attributes):
+        """
+        Times a block of code as one sample of the `name` histogram.
+
+        Parameters:
+        - name (str): Stage name (e.g. 'embed')
+        - attributes: Extra fields stored with the record
+
+        Returns:
+        - A context manager; call `.set(...)` on it to add attributes inside the block
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attributes)
+
+    def observe(self, name, ms, **attributes):
+        """
+        Records a duration measured elsewhere.
+
+        Parameters:
+        - name (str): Stage name
+        - ms (float): Duration in milliseconds
+        - attributes: Extra fields stored with the record
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histograms.setdefault(name, deque(maxlen=HISTOGRAM_SAMPLES)).append(ms)
+            self._write({"ts": time.time(), "type": "span", "name": name, "ms": round(ms, 3), **attributes})
+
+    def count(self, name, value=1, **attributes):
+        """
+        Adds `value` to a counter (e.g. chunks embedded, cache hits).
+
+        Parameters:
+        - name (str): Counter name
+        - value (int): Amount to add
+        - attributes: Extra fields stored with the record
+        """
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            self._write({"ts": time.time(), "type": "count", "name": name, "value": value, **attributes})
+
+    def snapshot(self):
+        """
+        Summarises everything recorded so far.
+
+        Returns:
+        - dict: 'counters' and, per span name, count, mean, p50, p95, p99 and max in milliseconds
+        """
+        with self._lock:
+            histograms = {name: sorted(samples) for name, samples in self._histograms.items()}
+            counters = dict(self._counters)
+
+        def percentile(ordered, q):
+            return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+        return {
+            "counters": counters,
+            "spans": {
+                name: {
+                    "count": len(ordered),
+                    "mean_ms": sum(ordered) / len(ordered),
+                    "p50_ms": percentile(ordered, 50),
+                    "p95_ms": percentile(ordered, 95),
+                    "p99_ms": percentile(ordered, 99),
+                    "max_ms": ordered[-1],
+                }
+                for name, ordered in histograms.items() if ordered
+            },
+        }
+
+    def dump(self, path=None):
+        """
+        Writes the current snapshot as JSON and logs it.
+
+        Parameters:
+        - path (str): Output file (defaults to the metrics file with a .summary.json suffix)
+
+        Returns:
+        - str: The file written
+        """
+        path = path or self.path.replace(".jsonl", ".summary.json")
+        snapshot = self.snapshot()
+        with open(path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        logging.info("Metrics summary written to %s: %s", path, snapshot)
+        return path
+
+    def reset(self):
+        """
+        Clears all counters and histograms.
+        """
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+# Process-wide metrics; import with `from logger import metrics`
+metrics = Metrics()
+